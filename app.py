@@ -3,11 +3,14 @@
 # Importis
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 import data_processing as dp
 import charts
-import tempfile
-import os  
+import rendering
+import pdf_rendering
+import report_jobs
+import instrumentation
+import folder_watch
+import json
 
 
 
@@ -18,65 +21,93 @@ st.title("📊 Gerador de Relatórios Automático")
 st.write("Carregue seu arquivo CSV para visualizar os dados e gerar relatorios interativos")
 
 
-uploaded_file = st.file_uploader("Envie um arquivo CSV", type=['csv'])
+uploaded_files = st.file_uploader("Envie um ou mais arquivos CSV", type=['csv'], accept_multiple_files=True)
 
-if not uploaded_file:
+# Medições de tempo e memoria de cada etapa desta execução da pagina
+show_diagnostics = st.sidebar.checkbox("Mostrar diagnóstico de desempenho")
+recorder = instrumentation.start_recording()
+
+# Pasta monitorada: os arquivos que chegarem nela sao adicionados automaticamente aos dados
+watched_folder = st.sidebar.text_input("Pasta monitorada (opcional)")
+
+files = list(uploaded_files or [])
+
+if watched_folder:
+    try:
+        watcher = folder_watch.get_watcher(watched_folder)
+        files += watcher.files()
+
+        @st.fragment(run_every=5)
+        def check_watched_folder():
+            if watcher.consume_changes():
+                st.rerun()
+
+        check_watched_folder()
+    except (ValueError, OSError) as e:
+        st.sidebar.error(f"Não foi possível monitorar a pasta: {e}")
+
+if not files:
     st.warning("Por favor, faça o upload de um arquivo CSV")
     st.stop()
 
 
 try:
-    # Carregando os dados do arquivo fornecido
-    df = dp.load_data(uploaded_file)
-
-    # Realizando as validações para garantir que o arquivo esteja apto para ser manipulado
-    df = dp.validations(df)
+    # Carregando e validando os dados dos arquivos fornecidos, o resultado fica em cache entre as interações com a pagina
+    # Quando um novo arquivo e adicionado apenas ele e processado e somado aos dados ja carregados
+    df = dp.load_validated_files(files)
 
     st.subheader("Dados Carregados")
     st.write(df)
 
+    # Linhas rejeitadas nas validações, o restante do arquivo segue normalmente
+    rejections = df.attrs.get('rejections', {})
+    if rejections:
+        st.warning("Algumas linhas foram desconsideradas: " + ", ".join(
+            f"{dp.REJECTION_REASONS[reason]} ({count:,})" for reason, count in rejections.items()
+        ))
+
+        rejected = dp.get_rejected_rows(df)
+        if rejected is not None:
+            with st.expander("Ver linhas rejeitadas"):
+                st.write(rejected)
+                st.download_button(
+                    "Baixar linhas rejeitadas (CSV)",
+                    data=rejected.to_csv(index=False),
+                    file_name="linhas_rejeitadas.csv",
+                    mime="text/csv"
+                )
+
+    if 'memory_footprint' in df.attrs:
+        footprint = df.attrs['memory_footprint']
+        st.caption(f"Memória utilizada: {footprint['before'] / 1024 ** 2:,.1f} MB → {footprint['after'] / 1024 ** 2:,.1f} MB")
+
+
+    # Cubo de vendas por dia e produto, construido uma vez por arquivo e usado por todos os graficos
+    cube = dp.get_sales_cube(df)
+
+    # Resumo com as metricas, os totais por produto e por dia, usado pela pagina e pelo relatorio
+    summary = cube.summary()
 
     st.subheader("Insights")
     col1, col2, col3, col4 = st.columns(4)
     with col3:
-
-        total_items_sold = df['Quantidade'].sum()
-        
-
-        st.metric(label="Total de itens vendidos", value=f"{total_items_sold:,}")
+        st.metric(label="Total de itens vendidos", value=f"{summary.total_items_sold:,}")
     with col2:
-        total_biling = df["Total de Vendas"].sum()
-        st.metric(label="Faturamento Total", value=f"R$ {total_biling:,.2f}")
+        st.metric(label="Faturamento Total", value=f"R$ {summary.total_billing:,.2f}")
     
     with col1:
-        total_orders = len(df)
-        st.metric(label="Total de pedidos", value=f"{total_orders:,}")
+        st.metric(label="Total de pedidos", value=f"{summary.total_orders:,}")
     with col4:
-        avg_ticket = dp.get_avarage_ticket(df)
-        st.metric(label="Ticket Médio", value=f"R$ {avg_ticket:,.2f}")
+        st.metric(label="Ticket Médio", value=f"R$ {summary.avg_ticket:,.2f}")
 
     col1, col2 = st.columns(2)
 
     with col1:
-
-        name, quantity, total_sales = dp.get_best_profitable_product(df)
-
-        fig_best_profitable = charts.create_pie_chart(pd.DataFrame({
-            "Produto": [name, 'Outros'],
-            "Total em vendas": [total_sales, df["Total de Vendas"].sum() - total_sales]
-        }), f"Comparção do produto mais lucrativo {name}, com os demais.")
-        
-        
+        fig_best_profitable = charts.create_best_profitable_chart(summary)
         st.plotly_chart(fig_best_profitable)
 
     with col2:
-        name, quantity, total_sales = dp.get_best_selling_product(df)
-
-        fig_best_selling_product = charts.create_pie_chart(pd.DataFrame({
-            'Produto': [name, "Outros"],
-            'Quantidade': [quantity, df['Quantidade'].sum() - quantity],
-        }), f"Comparação do produto mais vendido {name}, como os demais.")
-
+        fig_best_selling_product = charts.create_best_selling_chart(summary)
         st.plotly_chart(fig_best_selling_product)
 
     """ Insight de Crecimento diario grafico de linha """
@@ -84,45 +115,43 @@ try:
 
     
 
-    data_range_ts = st.date_input("Selecionar o periodo", [])
-    
-    daily_sales = df.groupby("Data")["Total de Vendas"].sum()
-    if len(data_range_ts) == 2:
-        daily_sales = dp.filter_by_date(df, data_range_ts[0], data_range_ts[1], "Data")
-        daily_sales.groupby("Quantidade")["Total de Vendas"].sum()
-    
-        
+    col1, col2 = st.columns(2)
+    with col1:
+        data_range_ts = st.date_input("Selecionar o periodo", [])
+    with col2:
+        granularity = st.selectbox("Agrupar por", list(dp.SalesCube.FREQUENCIES))
+
+    daily_sales = cube.slice(
+        *(data_range_ts if len(data_range_ts) == 2 else (None, None))
+    ).by_day(dp.SalesCube.FREQUENCIES[granularity])[["Total de Vendas"]]
 
     
-    fig_total_sales = px.line(
-        daily_sales, 
-        x=daily_sales.index, 
-        y="Total de Vendas",
-        title=""
-    )
+    fig_total_sales = charts.create_daily_sales_chart(daily_sales)
 
     st.plotly_chart(fig_total_sales)
     
     # ========================================================== 
     # ================  INSIGHT DE QUANTIDADE TOTAL VENDIDA POR PRODUTOS ===============
-    dataFrame = df
+    # Indices por data e por produto, construidos uma vez por arquivo
+    sales_index = dp.get_sales_index(df)
+
     col1, col2, col3, col4 = st.columns(4)
     with col1:
         data_range_dbp = st.date_input("Selecione o periodo entre datas que deseja filtrar", [])
         
-        if len(data_range_dbp) == 2:
-            dataFrame = dp.filter_by_date(dataFrame, data_range_dbp[0], data_range_dbp[1], "Data")
-        
     with col2:
-        selected_products = st.multiselect("Filtrar por produto", df["Produto"].unique())
-
-        if selected_products:
-            dataFrame = dataFrame[dataFrame["Produto"].isin(selected_products)]
+        selected_products = st.multiselect("Filtrar por produto", sales_index.products)
 
+    # Periodo e produtos sao resolvidos pelo cubo, as linhas do frame so sao usadas (pelos indices)
+    # quando os filtros de preço ou de quantidade minima estao ativos
+    date_filter = data_range_dbp if len(data_range_dbp) == 2 else (None, None)
+    selection = cube.slice(*date_filter, selected_products)
+    dataFrame = None
         
     with col3:
 
-        min_price, max_price = dataFrame["Preço Unitário"].min(), dataFrame["Preço Unitário"].max()
+        min_price, max_price = selection.min_price, selection.max_price
+        price_bounds = (min_price, max_price)
 
         if min_price == max_price:
             min_price -=1
@@ -135,9 +164,11 @@ try:
             (float(min_price), float(max_price))
         )
 
-        dataFrame = dataFrame[
-            (dataFrame["Preço Unitário"] >= selected_price[0]) & (dataFrame["Preço Unitário"] <= selected_price[1])
-        ]
+        if selected_price[0] > price_bounds[0] or selected_price[1] < price_bounds[1]:
+            dataFrame = sales_index.select(*date_filter, selected_products)
+            dataFrame = dataFrame[
+                (dataFrame["Preço Unitário"] >= selected_price[0]) & (dataFrame["Preço Unitário"] <= selected_price[1])
+            ]
         
         
     with col4:
@@ -145,28 +176,26 @@ try:
         min_quantity = st.number_input(
             "Mostrar produtos com minimo de X quantidade vendidas.",
             min_value=1,
-            max_value=int(dataFrame["Quantidade"].max()),
+            max_value=int(selection.max_quantity if dataFrame is None else dataFrame["Quantidade"].max()),
             value=1,
             step=1
         )
 
-        dataFrame = dataFrame[dataFrame["Quantidade"] >= min_quantity]
+        if min_quantity > selection.min_quantity:
+            if dataFrame is None:
+                dataFrame = sales_index.select(*date_filter, selected_products)
+            dataFrame = dataFrame[dataFrame["Quantidade"] >= min_quantity]
         
     
 
+    if dataFrame is None:
+        sales_distribuition = selection.by_product()["Quantidade"]
+    else:
+        sales_distribuition = dp.sum_by(dataFrame, "Produto", "Quantidade")
 
-    sales_distribuition = dataFrame.groupby("Produto")["Quantidade"].sum().sort_values(ascending=False)
-
-    sales_distribuition_zf = sales_distribuition.reset_index()
+    sales_distribuition = sales_distribuition.sort_values(ascending=False)
 
-    fig_sales_distribuition_by_product = px.bar(
-        sales_distribuition_zf,
-        x="Produto",
-        y="Quantidade",
-        title="Distribuição de vendas por produto.",
-        color="Quantidade",
-        color_continuous_scale=px.colors.sequential.Plasma,
-    )
+    fig_sales_distribuition_by_product = charts.create_sales_distribution_chart(sales_distribuition)
     st.plotly_chart(fig_sales_distribuition_by_product)
 
     col1, col2, col3, col4 = st.columns(4)
@@ -178,25 +207,7 @@ try:
     
     if st.button("Gerar Relatório em PDF"):
         
-        
-        
         try:
-            best_profitable_fig_path = dp.save_chart_as_temp_image(fig_best_profitable)
-            total_sales_fig_path = dp.save_chart_as_temp_image(fig_total_sales)
-            best_selling_fig_path = dp.save_chart_as_temp_image(fig_best_selling_product)
-            sales_distribuition_fig_path = dp.save_chart_as_temp_image(fig_sales_distribuition_by_product)
-
-            # Salva todos os caminhos das imagens em um array para excluir depois que forem utilizadas
-            temp_files = [
-                best_profitable_fig_path,
-                total_sales_fig_path,
-                best_selling_fig_path,
-                sales_distribuition_fig_path
-            ]
-
-            total_biling = f"{total_biling:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-            avg_ticket = f"{avg_ticket:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-
             if len(data_range_dbp) == 0:
                 data_range_dbp = ('NÃO', 'SELECIONADO')
             
@@ -208,18 +219,7 @@ try:
 
 
             data_report = {
-                'metrics': {
-                    'total_orders': total_orders,
-                    'total_items_sold': total_items_sold,
-                    'total_biling': total_biling,
-                    'avg_ticket': avg_ticket,
-                },
-                'graphics_path': {
-                    'best_profitable': best_profitable_fig_path,
-                    'total_sales': total_sales_fig_path,
-                    'best_selling_product': best_selling_fig_path,
-                    'sales_distribuition': sales_distribuition_fig_path
-                },
+                'summary': summary,
                 'filters_chart_distribuition_by_product': {
                     'data_range_dbp': data_range_dbp,
                     'selected_products': selected_products,
@@ -233,21 +233,80 @@ try:
 
             }
 
-            
-            
-            dp.generate_pdf(data_report, report_name)
+            # O relatorio e gerado em segundo plano (graficos exportados em paralelo e pdf), a pagina apenas acompanha o andamento
+            job = report_jobs.submit_report({
+                'best_profitable': fig_best_profitable,
+                'total_sales': fig_total_sales,
+                'best_selling_product': fig_best_selling_product,
+                'sales_distribuition': fig_sales_distribuition_by_product,
+            }, data_report, report_name)
 
-            st.success('Relatório gerado com sucesso, esta na pasata Documentos/relatorios/')
-            
+            st.session_state['report_job'] = (job.id, report_name)
             
         except Exception as e:
             st.error(f"Ocorreu um erro ao gerar o relatório: {e}")
 
-        finally:
-            # Exclui as imagens temporárias
-            for file in temp_files:
-                if file:
-                    os.remove(file)
+    if 'report_job' in st.session_state:
+        job_id, job_report_name = st.session_state['report_job']
+        job = report_jobs.get_job_manager().get(job_id)
+        polling = job is not None and not job.done
+
+        # Enquanto o relatorio esta sendo gerado apenas este trecho da pagina e atualizado
+        @st.fragment(run_every=1 if polling else None)
+        def report_status():
+            job = report_jobs.get_job_manager().get(job_id)
+
+            if job is None:
+                st.session_state.pop('report_job', None)
+                return
+
+            if not job.done:
+                st.progress(job.progress, text=f"{job.message}...")
+                return
+
+            if job.status == report_jobs.FAILED:
+                st.error(f"Ocorreu um erro ao gerar o relatório: {job.error}")
+                return
+
+            # O fragmento estava sendo atualizado a cada segundo, a pagina e recarregada para parar a atualização
+            if polling:
+                st.rerun()
+
+            result = job.result
+            st.success('Relatório gerado com sucesso, esta na pasata Documentos/relatorios/')
+            st.download_button("Baixar relatório", data=result.pdf, file_name=job_report_name if job_report_name.lower().endswith(".pdf") else f"{job_report_name}.pdf", mime="application/pdf")
+            st.caption("Tempo de exportação dos graficos: " + ", ".join(
+                f"{name} {seconds:.2f}s" if seconds is not None else f"{name} (cache)" for name, seconds in result.chart_seconds.items()
+            ))
+
+        report_status()
+
+    if show_diagnostics:
+        with st.expander("Diagnóstico de desempenho", expanded=True):
+            st.caption(f"Tempo total medido: {recorder.total_seconds:.3f}s")
+            st.dataframe(pd.DataFrame(recorder.to_dict()))
+
+            st.caption(f"Relatórios na fila: {report_jobs.get_job_manager().queue_depth}")
+
+            report_cache = rendering.REPORT_CACHE.stats()
+            st.caption(
+                f"Cache de graficos e pdfs: {report_cache['hits']} acertos, {report_cache['misses']} falhas, "
+                f"{report_cache['files']} arquivos ({report_cache['bytes'] / 1024 ** 2:,.1f} MB)"
+            )
+
+            pdf_stats = pdf_rendering.render_stats()
+            if pdf_stats is not None:
+                st.caption(
+                    f"Fila de pdf ({pdf_stats.renderer}, {pdf_stats.workers} workers): {pdf_stats.queued} aguardando, "
+                    f"{pdf_stats.running} em andamento, {pdf_stats.completed} gerados, {pdf_stats.failed} com erro, "
+                    f"media {pdf_stats.avg_seconds:.2f}s, maximo {pdf_stats.max_seconds:.2f}s"
+                )
+            st.download_button(
+                "Baixar diagnóstico (JSON)",
+                data=json.dumps(recorder.to_dict(), ensure_ascii=False, indent=2),
+                file_name="diagnostico.json",
+                mime="application/json"
+            )
 
         
 
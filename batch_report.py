@@ -0,0 +1,176 @@
+"""
+    Geração de relatorios em lote, sem iniciar o streamlit
+
+    uso: python batch_report.py <pasta ou glob> [--output pasta] [--workers N] [--stream] [--json resumo.json]
+
+    Arquivos a partir de STREAM_MIN_BYTES (ou todos, com --stream) sao lidos em blocos, sem carregar o arquivo inteiro na memoria.
+
+    exemplos:
+        python batch_report.py vendas/
+        python batch_report.py "vendas/loja_*.csv" --output relatorios --workers 8
+        python batch_report.py historico/ --stream --workers 2
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import charts
+import instrumentation
+import data_processing as dp
+from rendering import render_charts
+
+
+# Tamanho do arquivo (em bytes) a partir do qual ele e lido em blocos com dp.stream_aggregates
+STREAM_MIN_BYTES = 1024 ** 3
+
+
+def find_files(source: str) -> list:
+    """ Retorna os arquivos csv de uma pasta ou de um padrão glob """
+    if os.path.isdir(source):
+        return sorted(str(path) for path in Path(source).glob("*.csv"))
+    return sorted(glob.glob(source))
+
+
+def build_report(csv_path: str, output_dir: str, stream: bool = None) -> dict:
+    """
+        Executa o pipeline completo para um arquivo: leitura, validações, resumo, graficos e pdf
+        :param csv_path -> Caminho do arquivo csv
+        :param output_dir -> Pasta onde o pdf e salvo
+        :param stream -> Le o arquivo em blocos. Por padrão apenas para arquivos com pelo menos STREAM_MIN_BYTES
+        :return -> Dicionario com o arquivo, quantidade de linhas, tempo gasto, medições de cada etapa e o erro (caso tenha ocorrido)
+    """
+
+    start = time.perf_counter()
+    if stream is None:
+        stream = os.path.getsize(csv_path) >= STREAM_MIN_BYTES
+
+    result = {"file": csv_path, "rows": 0, "rejected": {}, "stream": stream, "seconds": 0.0, "output": None, "error": None, "stages": []}
+
+    with instrumentation.recording() as recorder:
+        _build_report(csv_path, output_dir, result)
+
+    result["stages"] = recorder.to_dict()
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def _build_report(csv_path: str, output_dir: str, result: dict):
+    try:
+        if result["stream"]:
+            summary = dp.stream_aggregates(csv_path)
+        else:
+            # Ja estamos em um processo do pool, a agregação nao abre outro pool de processos
+            summary = dp.build_summary(dp.optimize_dtypes(dp.validations(dp.load_data(csv_path))), parallel=False)
+
+        result["rows"] = summary.total_orders
+        result["rejected"] = summary.rejections
+        min_price, max_price = summary.price_range
+
+        # Ja estamos em um processo do pool, entao os graficos sao exportados em sequencia
+        images = render_charts(charts.create_report_charts(summary), parallel=False)
+
+        data_report = {
+            'summary': summary,
+            'graphics_path': images,
+            'filters_chart_distribuition_by_product': {
+                'data_range_dbp': ('NÃO', 'SELECIONADO'),
+                'selected_products': [],
+                'min_quantity': 1,
+                'min_price': min_price,
+                'max_price': max_price,
+            },
+            'filters_chart_total_sales': {
+                'data_range_ts': ('NÃO', 'SELECIONADO'),
+            },
+        }
+
+        pdf = dp.generate_pdf(data_report, Path(csv_path).stem, save=False)
+
+        output = Path(output_dir) / f"{Path(csv_path).stem}.pdf"
+        output.write_bytes(pdf)
+        result["output"] = str(output)
+
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+
+
+def run_batch(files: list, output_dir: str, workers: int = None, stream: bool = None) -> dict:
+    """
+        Gera os relatorios de todos os arquivos usando um pool de processos
+        :param files -> Lista de arquivos csv
+        :param output_dir -> Pasta onde os pdfs sao salvos
+        :param workers -> Quantidade de processos, por padrão a quantidade de CPUs
+        :param stream -> Le todos os arquivos em blocos. Por padrão apenas os com pelo menos STREAM_MIN_BYTES
+        :return -> Resumo com a vazão (arquivos/min, linhas/s), os resultados e as falhas
+    """
+
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build_report, csv_path, output_dir, stream) for csv_path in files]
+
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+
+            status = "ERRO " + result["error"] if result["error"] else "ok"
+            print(f"[{len(results)}/{len(files)}] {result['file']} ({result['rows']:,} linhas, {result['seconds']:.2f}s) {status}")
+
+    elapsed = time.perf_counter() - start
+    rows = sum(result["rows"] for result in results if not result["error"])
+    failures = [result for result in results if result["error"]]
+
+    return {
+        "files": len(files),
+        "succeeded": len(files) - len(failures),
+        "failed": len(failures),
+        "seconds": elapsed,
+        "files_per_minute": len(files) / elapsed * 60 if elapsed else 0.0,
+        "rows_per_second": rows / elapsed if elapsed else 0.0,
+        "failures": [{"file": result["file"], "error": result["error"]} for result in failures],
+        "results": sorted(results, key=lambda result: result["file"]),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera relatorios em pdf para varios arquivos csv")
+    parser.add_argument("source", help="Pasta com arquivos csv ou padrão glob (ex: 'vendas/*.csv')")
+    parser.add_argument("--output", default="relatorios", help="Pasta onde os pdfs sao salvos")
+    parser.add_argument("--workers", type=int, default=None, help="Quantidade de processos (padrão: quantidade de CPUs)")
+    parser.add_argument("--stream", action="store_true", default=None,
+                        help=f"Le todos os arquivos em blocos (padrão: apenas os com pelo menos {STREAM_MIN_BYTES // 1024 ** 2} MB)")
+    parser.add_argument("--json", dest="json_path", help="Salva o resumo da execução neste arquivo json")
+    args = parser.parse_args(argv)
+
+    files = find_files(args.source)
+    if not files:
+        print(f"Nenhum arquivo csv encontrado em {args.source}")
+        return 1
+
+    summary = run_batch(files, args.output, args.workers, args.stream)
+
+    print()
+    print(f"Arquivos: {summary['files']} ({summary['succeeded']} ok, {summary['failed']} com erro) em {summary['seconds']:.1f}s")
+    print(f"Vazão: {summary['files_per_minute']:.1f} arquivos/min, {summary['rows_per_second']:,.0f} linhas/s")
+
+    for failure in summary["failures"]:
+        print(f"  ERRO {failure['file']}: {failure['error']}")
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
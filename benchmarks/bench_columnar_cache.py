@@ -0,0 +1,77 @@
+"""
+    Compara o tempo de carregamento de um csv (leitura + validações) com a leitura do mesmo frame pelo cache colunar em disco
+
+    uso: python benchmarks/bench_columnar_cache.py [arquivo.csv] [--repeat N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+import data_processing as dp
+from cache import ColumnarCache
+
+
+def build_input(csv_path: str, repeat: int) -> str:
+    """
+        Repete as linhas do csv N vezes para simular arquivos maiores
+        Cada copia tem as datas deslocadas para que as linhas nao sejam removidas como duplicadas
+    """
+    if repeat <= 1:
+        return csv_path
+
+    df = dp.normalize_column_names(pd.read_csv(csv_path))
+    dates = pd.to_datetime(df["Data"])
+
+    copies = []
+    for i in range(repeat):
+        copy = df.copy()
+        copy["Data"] = (dates + pd.Timedelta(days=i)).dt.strftime("%m/%d/%Y")
+        copies.append(copy)
+
+    temp_file = tempfile.NamedTemporaryFile(suffix=".csv", delete=False)
+    temp_file.close()
+    pd.concat(copies, ignore_index=True).to_csv(temp_file.name, index=False)
+
+    return temp_file.name
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("csv", nargs="?", default=os.path.join(os.path.dirname(__file__), "..", "MOCK_DATA.csv"))
+    parser.add_argument("--repeat", type=int, default=1, help="Quantas vezes repetir as linhas do arquivo")
+    args = parser.parse_args()
+
+    csv_path = build_input(args.csv, args.repeat)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = ColumnarCache(cache_dir)
+        key = "benchmark"
+
+        df, cold = timed(lambda: dp.validations(dp.load_data(csv_path)))
+        _, write = timed(cache.put, key, df)
+        _, warm = timed(cache.get, key)
+
+    if csv_path != args.csv:
+        os.remove(csv_path)
+
+    print(f"Linhas:                  {len(df):,}")
+    print(f"CSV (leitura + validação): {cold:.3f}s")
+    print(f"Escrita no cache:          {write:.3f}s")
+    print(f"Leitura do cache:          {warm:.3f}s")
+    print(f"Ganho:                     {cold / warm:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+    Compara a soma por produto e por dia do groupby do pandas com a agregação dividida entre processos
+    (parallel_aggregation) para varias quantidades de processos, conferindo que os resultados sao iguais.
+
+    uso: python benchmarks/bench_parallel_aggregation.py [--size 10m] [--workers 2,4,8,16,32] [--repeat 3]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+
+import data_processing as dp
+import parallel_aggregation as pa
+from bench_pipeline import DATA_DIR, parse_size
+from synthetic_data import generate_sales_file
+
+
+COLUMNS = ["Quantidade", "Total de Vendas"]
+
+
+def best_of(repeat: int, func, *args):
+    """ Menor tempo entre as repetições, junto com o resultado da ultima """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", default="10m", help="Quantidade de linhas do arquivo sintetico (ex: 1m, 10m)")
+    parser.add_argument("--products", type=int, default=3000, help="Quantidade de produtos diferentes")
+    parser.add_argument("--days", type=int, default=730, help="Quantidade de dias cobertos")
+    parser.add_argument("--workers", default=None, help="Quantidades de processos separadas por virgula (padrão: 2, 4, ... ate a quantidade de CPUs)")
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada medição (vale o menor tempo)")
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",")]
+    else:
+        worker_counts = sorted({min(2 ** i, cpus) for i in range(1, cpus.bit_length() + 1)})
+
+    DATA_DIR.mkdir(exist_ok=True)
+    csv_path = DATA_DIR / f"sales_{args.size}_{args.products}p_{args.days}d.csv"
+    if not csv_path.exists():
+        print(f"Gerando {csv_path.name}...")
+        generate_sales_file(str(csv_path), parse_size(args.size), args.products, args.days)
+
+    df = dp.optimize_dtypes(dp.validations(dp.load_data(csv_path)))
+    print(f"{len(df):,} linhas, {df['Produto'].cat.categories.size:,} produtos, {df['Data'].nunique():,} dias, {cpus} CPUs\n")
+
+    for by in ["Produto", "Data"]:
+        expected, baseline = best_of(args.repeat, dp.sum_by, df, by, COLUMNS, False)
+        print(f"sum_by({by!r})")
+        print(f"  {'pandas groupby':<22} {baseline:8.3f}s")
+
+        for workers in worker_counts:
+            # Pool novo com a quantidade de processos medida, ja iniciado antes da medição
+            pa.shutdown_aggregation_executor()
+            pa.AGGREGATION_WORKERS = workers
+            pa.partitioned_sum_by(df.head(1000), by, COLUMNS, workers)
+
+            result, seconds = best_of(args.repeat, pa.partitioned_sum_by, df, by, COLUMNS, workers)
+            pd.testing.assert_frame_equal(result, expected, check_exact=False)
+
+            print(f"  {f'{workers} processos':<22} {seconds:8.3f}s  ({baseline / seconds:5.2f}x)")
+
+        print()
+
+    pa.shutdown_aggregation_executor()
+
+
+if __name__ == "__main__":
+    main()
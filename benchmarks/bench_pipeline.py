@@ -0,0 +1,196 @@
+"""
+    Mede o tempo e o pico de memoria de cada etapa do pipeline com arquivos sinteticos de varios tamanhos.
+    Os resultados ficam salvos em benchmarks/results/ e sao comparados com a execução anterior.
+
+    uso: python benchmarks/bench_pipeline.py [--sizes 10k,1m,10m] [--with-pdf]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pandas as pd
+
+import data_processing as dp
+from synthetic_data import generate_sales_file
+
+
+BENCHMARK_DIR = Path(__file__).parent
+DATA_DIR = BENCHMARK_DIR / "data"
+RESULTS_DIR = BENCHMARK_DIR / "results"
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(size: str) -> int:
+    """ Converte tamanhos como '10k' e '1m' em quantidade de linhas """
+    size = size.strip().lower()
+    if size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def measure(stages: list, name: str, rows: int, func, *args):
+    """ Executa a etapa registrando o tempo e o pico de memoria alocada durante ela """
+
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+
+    result = func(*args)
+
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+
+    stages.append({
+        "stage": name,
+        "rows": rows,
+        "seconds": seconds,
+        "peak_memory_mb": (peak - before) / 1024 ** 2,
+    })
+    print(f"  {name:<28} {seconds:8.3f}s  {(peak - before) / 1024 ** 2:9.1f} MB")
+
+    return result
+
+
+def run_pdf(summary, df):
+    """ Exporta os graficos e gera o pdf, como na geração em lote """
+    import charts
+    from rendering import render_charts
+
+    images = render_charts(charts.create_report_charts(summary))
+    data_report = {
+        'summary': summary,
+        'graphics_path': images,
+        'filters_chart_distribuition_by_product': {
+            'data_range_dbp': ('NÃO', 'SELECIONADO'),
+            'selected_products': [],
+            'min_quantity': 1,
+            'min_price': df["Preço Unitário"].min(),
+            'max_price': df["Preço Unitário"].max(),
+        },
+        'filters_chart_total_sales': {'data_range_ts': ('NÃO', 'SELECIONADO')},
+    }
+    return dp.generate_pdf(data_report, "benchmark", save=False)
+
+
+def bench_file(csv_path: Path, with_pdf: bool) -> list:
+    """ Mede todas as etapas do pipeline para um arquivo """
+
+    stages = []
+
+    df = measure(stages, "load_data", 0, dp.load_data, csv_path)
+    rows = len(df)
+    stages[-1]["rows"] = rows
+
+    df = measure(stages, "validations", rows, dp.validations, df)
+    df = measure(stages, "optimize_dtypes", rows, dp.optimize_dtypes, df)
+    df = df.sort_values("Data", kind="stable", ignore_index=True)
+
+    summary = measure(stages, "build_summary", rows, dp.build_summary, df)
+    measure(stages, "get_best_selling_product", rows, dp.get_best_selling_product, df)
+    measure(stages, "get_best_profitable_product", rows, dp.get_best_profitable_product, df)
+
+    # Filtra a metade central do periodo
+    first, last = df["Data"].iloc[0], df["Data"].iloc[-1]
+    start, end = first + (last - first) / 4, last - (last - first) / 4
+    products = summary.by_product["Quantidade"].nlargest(5).index.tolist()
+
+    measure(stages, "filter_by_date", rows, dp.filter_by_date, df, start, end, "Data")
+    index = measure(stages, "SalesIndex", rows, dp.SalesIndex, df)
+    measure(stages, "SalesIndex.select", rows, index.select, start, end, products)
+    measure(stages, "SalesCube", rows, dp.SalesCube.from_frame, df)
+
+    if with_pdf:
+        measure(stages, "charts + generate_pdf", rows, run_pdf, summary, df)
+
+    return stages
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecida"
+
+
+def previous_results():
+    """ Retorna os resultados da ultima execução salva, caso exista """
+    files = sorted(RESULTS_DIR.glob("pipeline-*.json"))
+    if not files:
+        return None
+    return json.loads(files[-1].read_text(encoding="utf-8"))
+
+
+def compare(current: dict, previous: dict):
+    """ Mostra a variação de tempo de cada etapa em relação a execução anterior """
+
+    old = {(r["size"], s["stage"]): s["seconds"] for r in previous["runs"] for s in r["stages"]}
+
+    print(f"\nComparação com a revisão {previous['revision']} ({previous['date']}):")
+    for run in current["runs"]:
+        for stage in run["stages"]:
+            before = old.get((run["size"], stage["stage"]))
+            if before:
+                change = (stage["seconds"] - before) / before * 100
+                flag = "  <-- regressão" if change > 20 else ""
+                print(f"  {run['size']:>6} {stage['stage']:<28} {before:8.3f}s -> {stage['seconds']:8.3f}s ({change:+.0f}%){flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10k,1m", help="Tamanhos dos arquivos separados por virgula (ex: 10k,1m,10m)")
+    parser.add_argument("--products", type=int, default=3000, help="Quantidade de produtos diferentes")
+    parser.add_argument("--days", type=int, default=730, help="Quantidade de dias cobertos")
+    parser.add_argument("--with-pdf", action="store_true", help="Inclui a exportação dos graficos e o pdf (requer kaleido e wkhtmltopdf)")
+    args = parser.parse_args()
+
+    DATA_DIR.mkdir(exist_ok=True)
+    RESULTS_DIR.mkdir(exist_ok=True)
+
+    previous = previous_results()
+    results = {
+        "revision": git_revision(),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "runs": [],
+    }
+
+    tracemalloc.start()
+
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        csv_path = DATA_DIR / f"sales_{size}_{args.products}p_{args.days}d.csv"
+
+        # Os arquivos gerados sao reaproveitados entre as execuções
+        if not csv_path.exists():
+            print(f"Gerando {csv_path.name}...")
+            generate_sales_file(str(csv_path), rows, args.products, args.days)
+
+        print(f"\n{size} linhas ({csv_path.stat().st_size / 1024 ** 2:,.0f} MB)")
+        results["runs"].append({"size": size, "stages": bench_file(csv_path, args.with_pdf)})
+
+    tracemalloc.stop()
+
+    output = RESULTS_DIR / f"pipeline-{datetime.datetime.now():%Y%m%d-%H%M%S}-{results['revision']}.json"
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"\nResultados salvos em {output}")
+
+    if previous:
+        compare(results, previous)
+
+
+if __name__ == "__main__":
+    main()
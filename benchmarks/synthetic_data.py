@@ -0,0 +1,105 @@
+"""
+    Gera arquivos csv sinteticos de vendas a partir do MOCK_DATA.csv, com os mesmos nomes de colunas
+
+    uso: python benchmarks/synthetic_data.py 1000000 vendas_1m.csv [--products 3000] [--days 730]
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+
+MOCK_DATA_PATH = os.path.join(os.path.dirname(__file__), "..", "MOCK_DATA.csv")
+
+# Linhas geradas e escritas por vez, mantem a memoria baixa mesmo para 10M de linhas
+WRITE_CHUNK_SIZE = 500_000
+
+
+def product_catalog(n_products: int, seed: int = 0) -> pd.DataFrame:
+    """
+        Cria o catalogo de produtos com os nomes do MOCK_DATA.csv (com variações quando e preciso mais produtos)
+        e um preço fixo para cada produto
+    """
+
+    rng = np.random.default_rng(seed)
+    mock = pd.read_csv(MOCK_DATA_PATH)
+    base_names = mock["produto"].drop_duplicates().tolist()
+
+    names = [
+        name if i < len(base_names) else f"{name} {i // len(base_names) + 1}"
+        for i, name in ((i, base_names[i % len(base_names)]) for i in range(n_products))
+    ]
+
+    low, high = int(mock["preco_unitario"].min()), int(mock["preco_unitario"].max())
+
+    # Popularidade dos produtos no formato de cauda longa, poucos produtos concentram a maioria das vendas
+    weights = 1 / np.arange(1, n_products + 1) ** 0.8
+    rng.shuffle(weights)
+
+    return pd.DataFrame({
+        "produto": names,
+        "preco_unitario": rng.integers(low, high + 1, n_products),
+        "peso": weights / weights.sum(),
+    })
+
+
+def generate_chunk(rng, catalog: pd.DataFrame, n_rows: int, start_date: pd.Timestamp, days: int) -> pd.DataFrame:
+    """ Gera um bloco de vendas com as colunas e o formato de data (m/d/aaaa) do MOCK_DATA.csv """
+
+    products = rng.choice(len(catalog), size=n_rows, p=catalog["peso"].to_numpy())
+    quantities = rng.integers(1, 101, n_rows)
+    prices = catalog["preco_unitario"].to_numpy()[products]
+    dates = start_date + pd.to_timedelta(rng.integers(0, days, n_rows), unit="D")
+
+    return pd.DataFrame({
+        "data": dates.strftime("%m/%d/%Y"),
+        "produto": catalog["produto"].to_numpy()[products],
+        "quantidade": quantities,
+        "preco_unitario": prices,
+        "total venda": prices * quantities,
+    })
+
+
+def generate_sales_file(path: str, n_rows: int, n_products: int = 3000, days: int = 730,
+                        start_date: str = "2022-01-01", seed: int = 0) -> str:
+    """
+        Gera um arquivo csv sintetico de vendas
+        :param path -> Caminho do arquivo gerado
+        :param n_rows -> Quantidade de linhas
+        :param n_products -> Quantidade de produtos diferentes
+        :param days -> Quantidade de dias cobertos pelas vendas
+        :param start_date -> Primeiro dia das vendas
+        :param seed -> Semente dos numeros aleatorios, o mesmo valor gera o mesmo arquivo
+        :return -> Caminho do arquivo gerado
+    """
+
+    rng = np.random.default_rng(seed)
+    catalog = product_catalog(n_products, seed)
+    start = pd.Timestamp(start_date)
+
+    written = 0
+    while written < n_rows:
+        size = min(WRITE_CHUNK_SIZE, n_rows - written)
+        chunk = generate_chunk(rng, catalog, size, start, days)
+        chunk.to_csv(path, mode="w" if written == 0 else "a", header=written == 0, index=False)
+        written += size
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera um arquivo csv sintetico de vendas")
+    parser.add_argument("rows", type=int, help="Quantidade de linhas")
+    parser.add_argument("output", help="Caminho do arquivo gerado")
+    parser.add_argument("--products", type=int, default=3000, help="Quantidade de produtos diferentes")
+    parser.add_argument("--days", type=int, default=730, help="Quantidade de dias cobertos")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_sales_file(args.output, args.rows, args.products, args.days, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
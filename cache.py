@@ -0,0 +1,335 @@
+""" Camadas de cache usadas pelo APP """
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+
+
+# Limite padrão de memória ocupada pelos DataFrames mantidos em cache (1 GB)
+DEFAULT_MAX_MEMORY_BYTES = 1024 ** 3
+
+# Limite padrão de espaço em disco ocupado pelo cache colunar (2 GB)
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 ** 3
+
+# Limite padrão de espaço em disco ocupado pelas imagens e pdfs gerados (256 MB)
+DEFAULT_MAX_REPORT_BYTES = 256 * 1024 ** 2
+
+# Idade (em segundos) a partir da qual um arquivo temporario dos caches em disco e considerado abandonado
+STALE_TEMP_SECONDS = 60 * 60
+
+# Tamanho do bloco lido por vez ao calcular o hash de um arquivo
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file) -> str:
+    """
+        Calcula o hash do conteúdo de um arquivo, seja ele um caminho ou um objeto de arquivo (ex: UploadedFile do streamlit)
+        :param file -> Caminho ou objeto de arquivo
+        :return -> Hash hexadecimal do conteúdo
+    """
+
+    hasher = hashlib.blake2b(digest_size=16)
+
+    if hasattr(file, "getvalue"):
+        hasher.update(file.getvalue())
+    elif hasattr(file, "read"):
+        position = file.tell()
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+        file.seek(position)
+    else:
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+
+    return hasher.hexdigest()
+
+
+class DataFrameCache:
+    """
+        Cache LRU de DataFrames em memória, limitado pela memória total ocupada pelos frames.
+        Tambem aceita estruturas derivadas dos frames que informem o tamanho em 'nbytes'.
+        Os frames mais antigos (menos usados) são descartados quando o limite é ultrapassado.
+        O cache e compartilhado pelas sessoes do streamlit (uma thread por sessao), por isso todo acesso passa por um lock.
+    """
+
+    def __init__(self, max_memory_bytes: int = DEFAULT_MAX_MEMORY_BYTES):
+        self.max_memory_bytes = max_memory_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """
+            Retorna o frame salvo para a chave ou None caso ele nao esteja em cache
+            O frame retornado e uma copia rasa, assim o chamador pode adicionar ou trocar colunas sem alterar o cache
+            Outros objetos (ex: indices derivados do frame) sao retornados como foram guardados
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        value, _ = entry
+        return value.copy(deep=False) if isinstance(value, pd.DataFrame) else value
+
+    def put(self, key, df):
+        """
+            Adiciona um frame ao cache e descarta os menos usados ate respeitar o limite de memória.
+            Objetos que nao sao DataFrame precisam informar o tamanho pelo atributo 'nbytes'.
+            Frames maiores que o limite nao sao guardados.
+        """
+
+        # O tamanho e calculado fora do lock, ele percorre as colunas do frame
+        size = int(df.memory_usage(deep=True).sum()) if isinstance(df, pd.DataFrame) else int(df.nbytes)
+
+        with self._lock:
+            if key in self._entries:
+                self.memory_bytes -= self._entries.pop(key)[1]
+
+            if size > self.max_memory_bytes:
+                return
+
+            self._entries[key] = (df, size)
+            self.memory_bytes += size
+
+            while self.memory_bytes > self.max_memory_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.memory_bytes -= evicted_size
+
+    def discard(self, *keys):
+        """ Remove as chaves do cache, ignorando as que nao estao nele """
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.memory_bytes -= entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.memory_bytes = 0
+
+
+def default_cache_dir() -> Path:
+    """ Retorna a pasta de cache do usuario usada pelo APP """
+    from platformdirs import user_cache_dir
+
+    return Path(user_cache_dir("gerador_de_relatorios"))
+
+
+def write_atomic(path: Path, write):
+    """
+        Grava o arquivo em um nome temporario unico e so entao o move para o caminho final: leitores nunca veem
+        um arquivo pela metade e duas gravações da mesma chave ao mesmo tempo nao se misturam.
+        O temporario e removido caso a gravação falhe.
+        :param path -> Caminho final do arquivo
+        :param write -> Função que recebe o caminho temporario e grava o conteudo nele
+    """
+
+    temp_path = path.with_name(f"{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+
+def evict_files(directory: Path, files, max_disk_bytes: int):
+    """
+        Remove os arquivos usados ha mais tempo ate respeitar o limite de espaço em disco, e os temporarios
+        abandonados por gravações interrompidas (os mais recentes que STALE_TEMP_SECONDS podem estar em uso)
+        :param directory -> Pasta do cache
+        :param files -> Arquivos do cache, sem os temporarios
+        :param max_disk_bytes -> Limite de espaço ocupado pelos arquivos
+    """
+
+    stale = time.time() - STALE_TEMP_SECONDS
+    for f in directory.glob("*.tmp"):
+        try:
+            if f.stat().st_mtime < stale:
+                f.unlink(missing_ok=True)
+        except FileNotFoundError:
+            continue
+
+    entries = []
+    for f in files:
+        try:
+            stat = f.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, f))
+
+    entries.sort(key=lambda item: item[0])
+    total = sum(size for _, size, _ in entries)
+
+    while entries and total > max_disk_bytes:
+        _, size, oldest = entries.pop(0)
+        total -= size
+        oldest.unlink(missing_ok=True)
+
+
+class ColumnarCache:
+    """
+        Cache em disco dos frames ja validados no formato colunar do Arrow (arquivos .arrow sem compressão).
+        A leitura e feita com memory map, assim reabrir um arquivo nao passa pelo parse do csv nem das datas.
+        Quando o espaço total ultrapassa o limite os arquivos usados ha mais tempo sao removidos.
+    """
+
+    suffix = ".arrow"
+
+    def __init__(self, directory=None, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES):
+        self.directory = Path(directory) if directory else default_cache_dir() / "datasets"
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def get(self, key):
+        """ Retorna o frame salvo para a chave ou None caso ele nao exista no disco """
+
+        path = self._path(key)
+
+        try:
+            source = pa.memory_map(str(path), "r")
+            table = pa.ipc.open_file(source).read_all()
+            # Atualiza a data de acesso para a remoção dos menos usados (o arquivo pode ter sido removido por outra sessao)
+            os.utime(path)
+        except (FileNotFoundError, pa.ArrowInvalid):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+
+        return table.to_pandas()
+
+    def put(self, key, df: pd.DataFrame):
+        """ Salva o frame no disco e remove os arquivos mais antigos caso o limite de espaço seja ultrapassado """
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+
+        def write(temp_path):
+            with pa.OSFile(str(temp_path), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+
+        # O mesmo arquivo pode ser salvo por duas sessoes ao mesmo tempo
+        write_atomic(self._path(key), write)
+
+        self.evict()
+
+    def _files(self) -> list:
+        return list(self.directory.glob(f"*{self.suffix}"))
+
+    def evict(self):
+        """ Remove os arquivos usados ha mais tempo ate respeitar o limite de espaço em disco """
+        if self.directory.exists():
+            evict_files(self.directory, self._files(), self.max_disk_bytes)
+
+    def clear(self):
+        if not self.directory.exists():
+            return
+        for f in [*self._files(), *self.directory.glob("*.tmp")]:
+            f.unlink(missing_ok=True)
+
+
+def hash_bytes(*parts) -> str:
+    """ Hash de um conjunto de textos ou bytes, usado como chave dos caches endereçados pelo conteúdo """
+
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        hasher.update(part.encode("utf-8") if isinstance(part, str) else part)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+class BlobCache:
+    """
+        Cache em disco de arquivos gerados (imagens dos graficos e pdfs), endereçado pelo hash das entradas.
+        Cada chave vira um arquivo <chave>.<extensão>; quando o espaço total ultrapassa o limite os arquivos
+        usados ha mais tempo sao removidos.
+    """
+
+    def __init__(self, directory=None, max_disk_bytes: int = DEFAULT_MAX_REPORT_BYTES):
+        self.directory = Path(directory) if directory else default_cache_dir() / "reports"
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, key, extension: str) -> Path:
+        return self.directory / f"{key}.{extension}"
+
+    def get(self, key, extension: str) -> bytes:
+        """ Retorna o conteudo salvo para a chave ou None caso ele nao exista no disco """
+
+        path = self._path(key, extension)
+
+        try:
+            data = path.read_bytes()
+            # Atualiza a data de acesso para a remoção dos menos usados
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return data
+
+    def put(self, key, data: bytes, extension: str):
+        """ Salva o conteudo no disco e remove os arquivos mais antigos caso o limite de espaço seja ultrapassado """
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # O mesmo arquivo pode ser gerado por duas threads ao mesmo tempo
+        write_atomic(self._path(key, extension), lambda temp_path: temp_path.write_bytes(data))
+
+        self.evict()
+
+    def _files(self) -> list:
+        return [f for f in self.directory.glob("*.*") if f.suffix != ".tmp"]
+
+    def evict(self):
+        """ Remove os arquivos usados ha mais tempo ate respeitar o limite de espaço em disco """
+        if self.directory.exists():
+            evict_files(self.directory, self._files(), self.max_disk_bytes)
+
+    def stats(self) -> dict:
+        """ Acertos, falhas, quantidade de arquivos e espaço ocupado """
+
+        files = self._files() if self.directory.exists() else []
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": len(files),
+            "bytes": sum(f.stat().st_size for f in files if f.exists()),
+        }
+
+    def clear(self):
+        if not self.directory.exists():
+            return
+        for f in [*self._files(), *self.directory.glob("*.tmp")]:
+            f.unlink(missing_ok=True)
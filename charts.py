@@ -1,7 +1,151 @@
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import plotly.express as px
+import plotly.graph_objects as go
 import  pandas as pd 
 
 
+# Quantidade de figuras mantidas em memoria pelo memoize_figure
+FIGURE_CACHE_SIZE = 64
+
+_figure_cache = OrderedDict()
+_figure_cache_lock = threading.Lock()
+
+# Layouts montados uma vez e reaproveitados por todas as figuras
+PIE_LAYOUT = go.Layout(template="plotly", legend={"tracegroupgap": 0})
+LINE_LAYOUT = go.Layout(
+    template="plotly",
+    xaxis={"title": {"text": "Data"}},
+    yaxis={"title": {"text": "Total de Vendas"}},
+)
+BAR_LAYOUT = go.Layout(
+    template="plotly",
+    xaxis={"title": {"text": "Produto"}},
+    yaxis={"title": {"text": "Quantidade"}},
+    coloraxis={"colorscale": px.colors.sequential.Plasma, "colorbar": {"title": {"text": "Quantidade"}}},
+    title={"text": "Distribuição de vendas por produto."},
+)
+
+
+def _data_hash(data) -> str:
+    """ Hash do conteudo de um DataFrame/Series (valores, indice, nomes e tipos) """
+
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+
+    names = list(data.columns) if isinstance(data, pd.DataFrame) else [data.name]
+    dtypes = list(data.dtypes) if isinstance(data, pd.DataFrame) else [data.dtype]
+    hasher.update(repr((names, [str(dtype) for dtype in dtypes], data.index.name)).encode())
+
+    return hasher.hexdigest()
+
+
+def memoize_figure(func):
+    """
+        Guarda as figuras ja criadas, usando como chave o hash dos dados agregados e os demais parametros.
+        Quando os dados e os filtros nao mudam entre as execuções da pagina a mesma figura e reaproveitada.
+        As figuras retornadas sao compartilhadas e nao devem ser alteradas.
+    """
+
+    @functools.wraps(func)
+    def wrapper(data, *args, **kwargs):
+        key = (func.__name__, _data_hash(data), args, tuple(sorted(kwargs.items())))
+
+        with _figure_cache_lock:
+            if key in _figure_cache:
+                _figure_cache.move_to_end(key)
+                return _figure_cache[key]
+
+        fig = func(data, *args, **kwargs)
+
+        with _figure_cache_lock:
+            _figure_cache[key] = fig
+            while len(_figure_cache) > FIGURE_CACHE_SIZE:
+                _figure_cache.popitem(last=False)
+
+        return fig
+
+    return wrapper
+
+
+# Quantidade maxima de pontos enviados ao navegador no grafico de linha
+LINE_POINT_BUDGET = 1500
+
+# Quantidade maxima de barras no grafico de distribuição por produto (incluindo a barra 'Outros')
+BAR_POINT_BUDGET = 40
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+        Reduz uma serie para 'threshold' pontos com o algoritmo Largest-Triangle-Three-Buckets,
+        que mantem os picos e vales visiveis no grafico.
+        :param x -> Valores do eixo x (numericos e ordenados)
+        :param y -> Valores do eixo y
+        :param threshold -> Quantidade de pontos desejada
+        :return -> Posições dos pontos escolhidos
+    """
+
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype="float64")
+    y = np.asarray(y, dtype="float64")
+
+    every = (n - 2) / (threshold - 2)
+    selected = np.empty(threshold, dtype="int64")
+    selected[0] = a = 0
+
+    for i in range(threshold - 2):
+        # Media do proximo bloco, usada como terceiro vertice do triangulo
+        avg_start = int(np.floor((i + 1) * every)) + 1
+        avg_end = min(int(np.floor((i + 2) * every)) + 1, n)
+        avg_x = x[avg_start:avg_end].mean()
+        avg_y = y[avg_start:avg_end].mean()
+
+        # Ponto do bloco atual que forma o maior triangulo com o ponto anterior e a media do proximo bloco
+        start = int(np.floor(i * every)) + 1
+        end = int(np.floor((i + 1) * every)) + 1
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+
+    selected[-1] = n - 1
+    return selected
+
+
+def downsample_time_series(data: pd.DataFrame, column: str, point_budget: int = LINE_POINT_BUDGET) -> pd.DataFrame:
+    """ Reduz a serie temporal (indexada pela data) para no maximo 'point_budget' pontos """
+
+    if len(data) <= point_budget:
+        return data
+
+    x = data.index.asi8 if isinstance(data.index, pd.DatetimeIndex) else np.arange(len(data))
+    return data.iloc[lttb_indices(x, data[column].to_numpy(), point_budget)]
+
+
+def top_n_with_others(data: pd.Series, max_items: int = BAR_POINT_BUDGET, label: str = "Outros") -> pd.Series:
+    """ Mantem os maiores valores e soma o restante em uma unica categoria 'Outros' """
+
+    if len(data) <= max_items:
+        return data
+
+    data = data.sort_values(ascending=False)
+    top = data.iloc[:max_items - 1]
+    others = pd.Series([data.iloc[max_items - 1:].sum()], index=[label])
+
+    result = pd.concat([pd.Series(top.to_numpy(), index=top.index.astype(str)), others])
+    result.index.name = data.index.name
+    result.name = data.name
+
+    return result
+
+
 def create_single_product_pie_chart(best_selling_product, quantity_selling, total_selling ):
     """
         Gera um grafico de pizza destacando  o produto com maior venda.
@@ -29,6 +173,7 @@ def create_single_product_pie_chart(best_selling_product, quantity_selling, tota
 
     return fig
 
+@memoize_figure
 def create_pie_chart(data: pd.DataFrame, title: str):
     
     """
@@ -39,16 +184,108 @@ def create_pie_chart(data: pd.DataFrame, title: str):
     
     label_column, value_column = data.columns
 
-    
-    fig = px.pie(
-        data_frame=data,
-        names=label_column,
-        values=value_column,
-        title=title,
-        color_discrete_sequence=px.colors.qualitative.Set3[:3],
+    fig = go.Figure(
+        go.Pie(
+            labels=data[label_column].astype(str).tolist(),
+            values=data[value_column].tolist(),
+            marker={"colors": px.colors.qualitative.Set3[:3]},
+            hovertemplate=f"{label_column}=%{{label}}<br>{value_column}=%{{value}}<extra></extra>",
+        ),
+        layout=PIE_LAYOUT,
     )
+    fig.update_layout(title={"text": title})
 
     return fig
 
 
+def create_best_profitable_chart(summary):
+    """
+        Grafico de pizza comparando o produto mais lucrativo com os demais
+        :param summary -> SalesSummary com os totais das vendas
+        :return -> Objeto grafico Plotly
+    """
+
+    name, quantity, total_sales = summary.best_profitable_product
+
+    return create_pie_chart(pd.DataFrame({
+        "Produto": [name, 'Outros'],
+        "Total em vendas": [total_sales, summary.total_billing - total_sales]
+    }), f"Comparção do produto mais lucrativo {name}, com os demais.")
+
+
+def create_best_selling_chart(summary):
+    """
+        Grafico de pizza comparando o produto mais vendido com os demais
+        :param summary -> SalesSummary com os totais das vendas
+        :return -> Objeto grafico Plotly
+    """
+
+    name, quantity, total_sales = summary.best_selling_product
+
+    return create_pie_chart(pd.DataFrame({
+        'Produto': [name, "Outros"],
+        'Quantidade': [quantity, summary.total_items_sold - quantity],
+    }), f"Comparação do produto mais vendido {name}, como os demais.")
+
+
+@memoize_figure
+def create_daily_sales_chart(daily_sales: pd.DataFrame, point_budget: int = LINE_POINT_BUDGET):
+    """
+        Grafico de linha com o total de vendas ao longo do tempo
+        Series maiores que 'point_budget' sao reduzidas (LTTB) antes de montar o grafico
+        :param daily_sales -> DataFrame indexado pela data com a coluna 'Total de Vendas'
+        :return -> Objeto grafico Plotly
+    """
+
+    daily_sales = downsample_time_series(daily_sales, "Total de Vendas", point_budget)
+
+    return go.Figure(
+        go.Scatter(
+            x=daily_sales.index,
+            y=daily_sales["Total de Vendas"].to_numpy(),
+            mode="lines",
+            hovertemplate="Data=%{x}<br>Total de Vendas=%{y}<extra></extra>",
+        ),
+        layout=LINE_LAYOUT,
+    )
+
+
+@memoize_figure
+def create_sales_distribution_chart(sales_distribuition: pd.Series, max_bars: int = BAR_POINT_BUDGET):
+    """
+        Grafico de barras com a quantidade vendida por produto
+        Apenas os 'max_bars' - 1 maiores produtos sao exibidos, o restante e somado na barra 'Outros'
+        :param sales_distribuition -> Series indexada pelo produto com a quantidade vendida
+        :return -> Objeto grafico Plotly
+    """
+
+    sales_distribuition = top_n_with_others(sales_distribuition, max_bars)
+    values = sales_distribuition.to_numpy()
+
+    return go.Figure(
+        go.Bar(
+            x=sales_distribuition.index.astype(str).tolist(),
+            y=values,
+            marker={"color": values, "coloraxis": "coloraxis"},
+            hovertemplate="Produto=%{x}<br>Quantidade=%{y}<extra></extra>",
+        ),
+        layout=BAR_LAYOUT,
+    )
+
+
+def create_report_charts(summary) -> dict:
+    """
+        Cria os quatro graficos do relatorio sem filtros, usado na geração de relatorios fora da pagina
+        :param summary -> SalesSummary com os totais das vendas
+        :return -> Dicionario nome -> Figura, com os nomes esperados pelo generate_pdf
+    """
+
+    return {
+        'best_profitable': create_best_profitable_chart(summary),
+        'total_sales': create_daily_sales_chart(summary.by_day[["Total de Vendas"]]),
+        'best_selling_product': create_best_selling_chart(summary),
+        'sales_distribuition': create_sales_distribution_chart(
+            summary.by_product["Quantidade"].sort_values(ascending=False)
+        ),
+    }
 
@@ -1,15 +1,38 @@
+import numpy as np
 import pandas as pd
-from plotly.graph_objects import Figure
+from pandas.api.types import union_categoricals
 import os
-import tempfile
+import hashlib
+import json
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from functools import cached_property
+from cache import ColumnarCache, DataFrameCache, hash_file
+from report import render_html, report_context
+from pdf_rendering import render_pdf
+from parallel_aggregation import AGGREGATION_WORKERS, PARALLEL_MIN_ROWS, partitioned_sum_by
+from instrumentation import stage
 
 
 
 
 
 def load_data(file_path):
-    """ Carrega os dados do arquivo.csv"""
-    return pd.read_csv(file_path)
+    """
+        Carrega os dados do arquivo.csv
+        Primeiro le apenas o cabeçalho: caso falte alguma coluna obrigatoria o arquivo e rejeitado sem ser carregado,
+        e as colunas que nao sao usadas pelo APP nem chegam a ser lidas.
+    """
+    with stage("load_data") as record:
+        columns = resolve_columns(sniff_header(file_path))
+
+        df = pd.read_csv(file_path, **reader_options(columns))
+        _rename_columns(df, columns)
+
+        record.rows = len(df)
+    return df
 
 
 COLUMN_MAPPING = {
@@ -21,6 +44,97 @@ COLUMN_MAPPING = {
 }
 
 
+# Versão do mapeamento e das regras de validação, faz parte da chave do cache em disco
+# Deve ser incrementada sempre que as validações mudarem o resultado do frame
+VALIDATION_VERSION = 7
+
+
+def mapping_version() -> str:
+    """ Retorna uma assinatura do COLUMN_MAPPING junto com a versão das validações """
+    mapping = json.dumps(COLUMN_MAPPING, sort_keys=True, ensure_ascii=False).encode()
+    return f"v{VALIDATION_VERSION}-{hashlib.blake2b(mapping, digest_size=4).hexdigest()}"
+
+
+def _column_key(name) -> str:
+    """ Normaliza o nome de uma coluna para a comparação: sem acentos, sem diferença de maiusculas e com '_' como espaço """
+    text = unicodedata.normalize("NFKD", str(name))
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.replace("_", " ").casefold().split())
+
+
+# Tabela de busca nome normalizado -> nome padrão, montada uma vez a partir do COLUMN_MAPPING
+COLUMN_LOOKUP = {
+    _column_key(alias): standard_name
+    for standard_name, possible_names in COLUMN_MAPPING.items()
+    for alias in possible_names
+}
+
+
+def resolve_columns(columns) -> dict:
+    """
+        Encontra o nome padrão de cada coluna do arquivo e verifica se todas as colunas obrigatorias estao presentes
+        :param columns -> Nomes das colunas do arquivo
+        :return -> Dicionario nome no arquivo -> nome padrão, apenas com as colunas usadas pelo APP
+    """
+
+    column_corrections = {}
+    found = set()
+
+    for file_column in columns:
+        standard_name = COLUMN_LOOKUP.get(_column_key(file_column))
+
+        # Caso o arquivo tenha duas colunas equivalentes, apenas a primeira e usada
+        if standard_name and standard_name not in found:
+            column_corrections[file_column] = standard_name
+            found.add(standard_name)
+
+    missing_columns = [col for col in COLUMN_MAPPING.keys() if col not in found]
+
+    if missing_columns:
+        raise ValueError(f"O arquivo CSV está faltando as seguintes colunas obrigatórias: {', '.join(missing_columns)}")
+
+    return column_corrections
+
+
+def sniff_header(file) -> list:
+    """ Le apenas o cabeçalho do arquivo csv, sem carregar as linhas """
+
+    if hasattr(file, "seek"):
+        position = file.tell()
+        columns = pd.read_csv(file, nrows=0).columns.tolist()
+        file.seek(position)
+        return columns
+
+    return pd.read_csv(file, nrows=0).columns.tolist()
+
+
+def reader_options(columns: dict) -> dict:
+    """
+        Parametros do pd.read_csv para ler apenas as colunas usadas, com os produtos ja como categoria
+        e as datas como texto (convertidas depois pelo parse_dates)
+        :param columns -> Dicionario retornado por resolve_columns
+    """
+
+    originals = {standard: original for original, standard in columns.items()}
+
+    return {
+        "usecols": list(columns),
+        "dtype": {originals["Produto"]: "category", originals["Data"]: str},
+    }
+
+
+def _rename_columns(df: pd.DataFrame, columns: dict):
+    """ Renomeia as colunas para o nome padrão e guarda o nome original de cada uma em df.attrs['column_sources'] """
+
+    df.rename(columns=columns, inplace=True)
+
+    # Guarda o nome original de cada coluna, usado para lembrar o formato de data de cada origem
+    df.attrs['column_sources'] = {
+        **df.attrs.get('column_sources', {}),
+        **{standard: original for original, standard in columns.items() if original != standard},
+    }
+
+
 def normalize_column_names(df: pd.DataFrame):
 
     """ 
@@ -28,67 +142,1230 @@ def normalize_column_names(df: pd.DataFrame):
         params: df -> aqui recebemos o frame de dados carregado
         return: df -> frame de dados com as colunas normalizadas
     """
-    column_corrections = {}
+    # Normaliza os nomes das colunas que vieram, usando a tabela de busca
+    column_corrections = resolve_columns(df.columns)
 
-    
-    # Normaliza os nomes das colunas que vieram
-    for standard_name, possible_names in COLUMN_MAPPING.items():
-        for file_column in df.columns:
-            if file_column in possible_names:
-                column_corrections[file_column ] = standard_name
-    
     # Renomeia as colunas
-    df.rename(columns=column_corrections, inplace=True)
+    _rename_columns(df, column_corrections)
+
+    
+    return df
 
+# Formatos de data testados na inferencia, em ordem de preferencia.
+# Mes antes do dia vem primeiro para manter o comportamento anterior em datas ambiguas (ex: 2/6/2024)
+DATE_FORMATS = [
+    "%m/%d/%Y", "%d/%m/%Y", "%Y-%m-%d", "%Y/%m/%d", "%d-%m-%Y", "%m-%d-%Y", "%d.%m.%Y",
+    "%Y-%m-%d %H:%M:%S", "%m/%d/%Y %H:%M", "%d/%m/%Y %H:%M", "%m/%d/%y", "%d/%m/%y",
+]
 
-    # Verifica se as colunas necessárias estão presentes após a normalização
-    missing_columns = [col for col in COLUMN_MAPPING.keys() if col not in df.columns]
+# Quantidade de valores distintos usados para inferir o formato
+DATE_SAMPLE_SIZE = 1000
 
-    if missing_columns:
-        raise ValueError(f"O arquivo CSV está faltando as seguintes colunas obrigatórias: {', '.join(missing_columns)}")
+# Formato de data inferido para cada nome de coluna de origem (ex: 'data', 'Data de Venda')
+DATE_FORMAT_CACHE = {}
+
+
+def infer_date_format(values: pd.Index):
+    """
+        Descobre o formato das datas testando os formatos conhecidos em uma amostra dos valores
+        :param values -> Valores distintos (texto) da coluna de datas
+        :return -> Formato encontrado ou None caso nenhum formato reconheça toda a amostra
+    """
+
+    sample = values[:DATE_SAMPLE_SIZE]
+
+    for date_format in DATE_FORMATS:
+        if pd.to_datetime(sample, format=date_format, errors="coerce").notna().all():
+            return date_format
+
+    return None
+
+
+def parse_dates(series: pd.Series, source: str = None) -> pd.Series:
+    """
+        Converte a coluna de datas usando um formato fixo, que e inferido apenas uma vez por coluna de origem.
+        Como as datas se repetem muito, apenas os valores distintos sao convertidos e depois espalhados para as linhas.
+        Caso nenhum formato conhecido funcione, usa a conversão generica do pandas (errors="raise").
+        :param series -> Coluna de datas
+        :param source -> Nome original da coluna no arquivo, usado para lembrar o formato
+        :return -> Coluna convertida para datetime
+    """
+
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+
+    codes, uniques = pd.factorize(series)
+    uniques = pd.Index(uniques).astype(str)
+
+    date_format = DATE_FORMAT_CACHE.get(source)
+    parsed = None
+
+    if date_format is not None:
+        parsed = pd.to_datetime(uniques, format=date_format, errors="coerce")
+        if parsed.isna().any():
+            # O arquivo mudou de formato, o formato e inferido novamente
+            parsed = None
+
+    if parsed is None:
+        date_format = infer_date_format(uniques)
+        if date_format is not None:
+            parsed = pd.to_datetime(uniques, format=date_format, errors="coerce")
+            if parsed.isna().any():
+                parsed = None
+            elif source is not None:
+                DATE_FORMAT_CACHE[source] = date_format
+
+    if parsed is None:
+        parsed = pd.to_datetime(uniques, errors="raise")
+
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=series.index, name=series.name)
+
+
+def coerce_types(df: pd.DataFrame):
+    """
+        Garante que as colunas estejam no tipo correto e preenche os valores numericos ausentes
+        :param df -> DataFrame com as colunas ja normalizadas
+        :return -> DataFrame com os tipos corrigidos
+    """
+
+    # estamos garantindo que o o tipos de dados estao no formato correto
+    with stage("coerce_types.numeric", rows=len(df)):
+        df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce')
+        df['Preço Unitário'] = pd.to_numeric(df['Preço Unitário'], errors='coerce')
+        df['Total de Vendas'] = pd.to_numeric(df["Total de Vendas"], errors='coerce')
+
+        # Garantindo valores padroes para as colunas
+        df.fillna({
+            'Quantidade': 0,
+            'Preço Unitário': 0,
+            'Total de Vendas': 0
+        }, inplace=True)
+
+    with stage("coerce_types.dates", rows=len(df)):
+        df['Data'] = parse_dates(df['Data'], source=df.attrs.get('column_sources', {}).get('Data', 'Data'))
 
-    
     return df
 
-def validations(df: pd.DataFrame):
-    """"
-        Realizando as validações necessarias para o dataframe e garantir que ele esteja pronto para o processamento"
+
+# Diferença maxima aceita entre o total de vendas e o preço unitario x quantidade (1 centavo)
+CONSISTENCY_TOLERANCE = 0.01
+
+# Motivos pelos quais uma linha e rejeitada nas validações
+REJECTION_REASONS = {
+    "DATA_AUSENTE": "Data ausente ou inválida",
+    "PRODUTO_AUSENTE": "Produto não informado",
+    "QUANTIDADE_INVALIDA": "Quantidade menor ou igual a zero",
+    "TOTAL_INCONSISTENTE": "Total de vendas diferente de preço unitário x quantidade",
+    "DUPLICADA": "Linha repetida",
+}
+
+
+def missing_keys(df: pd.DataFrame) -> tuple:
+    """
+        Mascaras das linhas sem data (ausente ou que nao pode ser lida) e sem produto (ausente ou em branco).
+        Essas linhas nao entram em nenhum agrupamento por dia ou por produto.
+    """
+
+    missing_date = df['Data'].isna().to_numpy()
+
+    products = df['Produto']
+    missing_product = products.isna().to_numpy()
+    if isinstance(products.dtype, pd.CategoricalDtype):
+        categories = products.cat.categories
+        missing_product |= products.isin(categories[categories.astype(str).str.strip() == ""]).to_numpy()
+    else:
+        missing_product |= (products.astype(str).str.strip() == "").to_numpy()
+
+    return missing_date, missing_product
+
+
+def check_consistency(df: pd.DataFrame) -> tuple:
+    """
+        Separa as linhas validas das linhas com problemas, sem interromper o processamento do arquivo.
+        Uma linha e rejeitada quando nao tem data ou produto, quando a quantidade e menor ou igual a zero ou quando
+        o total de vendas difere do preço unitario x quantidade em mais de CONSISTENCY_TOLERANCE.
+        :param df -> DataFrame com os tipos ja corrigidos
+        :return -> Tupla com o DataFrame valido e o DataFrame das linhas rejeitadas (com a coluna 'Motivo')
+    """
+
+    with stage("check_consistency", rows=len(df)):
+        missing_date, missing_product = missing_keys(df)
+
+        invalid_quantity = (df['Quantidade'] <= 0).to_numpy()
+
+        difference = (df['Preço Unitário'] * df['Quantidade'] - df['Total de Vendas']).abs()
+        inconsistent = (difference > CONSISTENCY_TOLERANCE).to_numpy()
+
+        rejected_mask = missing_date | missing_product | invalid_quantity | inconsistent
+
+        if not rejected_mask.any():
+            return df, df.iloc[0:0].assign(Motivo=pd.Series(dtype=object))
+
+        # A primeira condição que a linha nao cumpre define o motivo. A quantidade invalida vem antes do total,
+        # ja que ela tambem costuma gerar um total inconsistente
+        reasons = np.select(
+            [missing_date, missing_product, invalid_quantity],
+            ["DATA_AUSENTE", "PRODUTO_AUSENTE", "QUANTIDADE_INVALIDA"],
+            "TOTAL_INCONSISTENTE",
+        )[rejected_mask]
+
+        rejected = df[rejected_mask].assign(Motivo=reasons)
+        valid = df[~rejected_mask]
+
+    return valid, rejected
+
+
+def rejection_counts(rejected: pd.DataFrame) -> dict:
+    """ Quantidade de linhas rejeitadas por motivo """
+    return {reason: int(count) for reason, count in rejected['Motivo'].value_counts().items()}
+
+
+# Colunas usadas para identificar linhas repetidas
+CANONICAL_COLUMNS = ["Data", "Produto", "Quantidade", "Preço Unitário", "Total de Vendas"]
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+        Calcula um hash de 64 bits para cada linha a partir das colunas canonicas.
+        As colunas numericas sao convertidas para float antes, assim 5 e 5.0 geram o mesmo hash.
+    """
+
+    numeric = {column: 'float64' for column in ["Quantidade", "Preço Unitário", "Total de Vendas"]}
+    return pd.util.hash_pandas_object(df[CANONICAL_COLUMNS].astype(numeric), index=False).to_numpy()
+
+
+class SeenRows:
+    """
+        Conjunto dos hashes (64 bits) das linhas ja vistas. Ocupa 8 bytes por linha distinta, independente da largura das linhas.
+        Os hashes ficam em blocos ordenados: cada adição cria um bloco novo e os blocos pequenos sao unidos aos anteriores
+        quando chegam a metade do tamanho deles, assim adicionar linhas nao reordena todo o historico (custo amortizado linear)
+        e a consulta faz uma busca binaria por bloco (poucos blocos, ~log2 da quantidade de adições).
+        Os blocos nunca sao alterados depois de criados, entao copy() apenas compartilha os blocos existentes.
+        obs: com hashes de 64 bits a chance de alguma colisão entre n linhas e ~n²/2^65 (1 em ~370 mil para 10 milhoes de linhas).
+    """
+
+    def __init__(self, hashes: np.ndarray = None):
+        self.runs = []
+        if hashes is not None and len(hashes):
+            self.runs.append(np.unique(np.asarray(hashes, dtype=np.uint64)))
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self.runs)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(run.nbytes for run in self.runs)
+
+    def to_array(self) -> np.ndarray:
+        """ Todos os hashes em um unico array ordenado """
+        self._merge(0)
+        return self.runs[0] if self.runs else np.empty(0, dtype=np.uint64)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """ Mascara das linhas cujos hashes ja estao no conjunto """
+        found = np.zeros(len(hashes), dtype=bool)
+        for run in self.runs:
+            positions = np.minimum(np.searchsorted(run, hashes), len(run) - 1)
+            found |= run[positions] == hashes
+        return found
+
+    def add(self, hashes: np.ndarray):
+        """ Adiciona os hashes ao conjunto (os hashes podem se repetir ou ja estar no conjunto) """
+
+        if not len(hashes):
+            return
+
+        run = np.sort(np.asarray(hashes, dtype=np.uint64))
+        self.runs.append(run[np.concatenate(([True], run[1:] != run[:-1]))])
+
+        # Une os ultimos blocos enquanto o mais novo tiver pelo menos metade do tamanho do anterior
+        while len(self.runs) > 1 and 2 * len(self.runs[-1]) >= len(self.runs[-2]):
+            self._merge(len(self.runs) - 2)
+
+    def _merge(self, start: int):
+        """ Une os blocos a partir da posição informada em um unico bloco ordenado e sem repetições """
+
+        if len(self.runs) - start < 2:
+            return
+
+        merged = self.runs[start]
+        for run in self.runs[start + 1:]:
+            # Intercala dois blocos ordenados em tempo linear, descartando os hashes que ja estao no primeiro
+            positions = np.searchsorted(merged, run)
+            present = merged[np.minimum(positions, len(merged) - 1)] == run
+            merged = np.insert(merged, positions[~present], run[~present])
+
+        self.runs = self.runs[:start] + [merged]
+
+    def copy(self) -> "SeenRows":
+        """ Copia do conjunto que compartilha os blocos existentes, as adições na copia nao alteram este conjunto """
+        seen = SeenRows()
+        seen.runs = list(self.runs)
+        return seen
+
+
+def deduplicate(df: pd.DataFrame, seen: SeenRows = None) -> tuple:
+    """
+        Remove as linhas repetidas comparando os hashes das colunas canonicas, sem ordenar nem comparar as strings.
+        A primeira ocorrencia de cada linha e mantida.
+        :param df -> DataFrame com os tipos ja corrigidos
+        :param seen -> Conjunto de linhas ja vistas (ex: blocos ou envios anteriores). As linhas que ja estao nele
+            tambem sao removidas e as novas sao adicionadas a ele
+        :return -> Tupla com o DataFrame sem repetições e o DataFrame das linhas removidas
+    """
+
+    with stage("deduplicate", rows=len(df)):
+        hashes = row_hashes(df)
+
+        # Repetidas dentro do proprio frame
+        duplicated = pd.Series(hashes).duplicated().to_numpy()
+
+        # Repetidas em relação as linhas ja vistas
+        if seen is not None:
+            duplicated |= seen.contains(hashes)
+            seen.add(hashes[~duplicated])
+
+        if not duplicated.any():
+            return df, df.iloc[0:0]
+
+    return df[~duplicated], df[duplicated]
+
+
+def no_valid_rows_error(rejections: dict) -> ValueError:
+    """ Erro de um arquivo sem nenhuma linha valida: vazio ou com todas as linhas rejeitadas (quantidade por motivo) """
+
+    if not rejections:
+        return ValueError("O arquivo CSV nao possui dados.")
+
+    counts = ", ".join(f"{REJECTION_REASONS[reason]}: {count}" for reason, count in rejections.items())
+    return ValueError(f"Nenhuma linha do arquivo passou nas validações ({counts}).")
+
+
+def validate(df: pd.DataFrame, seen: SeenRows = None) -> tuple:
+    """
+        Realiza as validações e retorna tambem as linhas rejeitadas
+        :param df -> DataFrame carregado do csv
+        :param seen -> Conjunto de linhas ja vistas em envios anteriores, as repetidas sao rejeitadas (ver deduplicate)
+        :return -> Tupla com o DataFrame valido e o DataFrame das linhas rejeitadas (com a coluna 'Motivo')
     """
     # normaliza e verifica se as colunas necessarias estão presentes
     df = normalize_column_names(df=df)
 
-    # estamos garantindo que o o tipos de dados estao no formato correto
-    df['Quantidade'] = pd.to_numeric(df['Quantidade'], errors='coerce')
-    df['Preço Unitário'] = pd.to_numeric(df['Preço Unitário'], errors='coerce')
-    df['Total de Vendas'] = pd.to_numeric(df["Total de Vendas"], errors='coerce')
-    df['Data'] = pd.to_datetime(df['Data'], errors="raise")
-
-    # Garantindo valores padroes para as colunas
-    df.fillna({
-        'Quantidade': 0,
-        'Preço Unitário': 0,
-        'Total de Vendas': 0
-    }, inplace=True)
+    df = coerce_types(df)
 
     # Removendo dados duplicados
-    df.drop_duplicates(inplace=True)
+    df, duplicated = deduplicate(df, seen)
 
-    # Verificando se ha valores fora do esperado caso nao atenda ao requisito o dado nao e exibido
-    df = df[df['Quantidade'] > 0]
+    df, rejected = check_consistency(df)
 
-    # Verificando a consistencia dos dados
-    df['Vendas_validas'] = df['Preço Unitário'] * df['Quantidade'] == df['Total de Vendas']
+    if len(duplicated):
+        rejected = pd.concat([duplicated.assign(Motivo="DUPLICADA"), rejected])
 
-    if not df['Vendas_validas'].all():
-        raise ValueError("A consistência dos dados está comprometida. O total de vendas não corresponde ao valor calculado.")
+    if df.empty:
+        raise no_valid_rows_error(rejection_counts(rejected))
+
+    df.attrs['rejections'] = rejection_counts(rejected)
+
+    return df, rejected
+
+
+def validations(df: pd.DataFrame, seen: SeenRows = None):
+    """"
+        Realizando as validações necessarias para o dataframe e garantir que ele esteja pronto para o processamento"
+        As linhas rejeitadas sao descartadas, a quantidade por motivo fica em df.attrs['rejections']
+    """
+    df, _ = validate(df, seen)
     return df
 
 
+def memory_footprint(df: pd.DataFrame) -> int:
+    """ Retorna a memoria ocupada pelo frame em bytes, contando o conteudo das strings """
+    return int(df.memory_usage(deep=True).sum())
+
+
+def _downcast_integer(series: pd.Series) -> pd.Series:
+    """ Converte a coluna para o menor tipo inteiro possivel caso todos os valores sejam inteiros """
+    if pd.api.types.is_integer_dtype(series) or (series % 1 == 0).all():
+        return pd.to_numeric(series, downcast="integer")
+    return series
+
+
+def optimize_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """
+        Reduz a memoria ocupada pelo frame ja validado:
+        - 'Produto' vira categoria, ja que os mesmos produtos se repetem em milhares de linhas
+        - 'Quantidade', 'Preço Unitário' e 'Total de Vendas' usam o menor tipo inteiro possivel quando os valores sao inteiros
+        - 'Data' guarda apenas o dia
+        - a coluna 'Vendas_validas' (de versões anteriores) e removida, pois apos as validações ela e sempre verdadeira
+        O antes e depois da memoria fica salvo em df.attrs['memory_footprint']
+        :param df -> DataFrame ja validado
+        :return -> DataFrame com os tipos compactos
+    """
+
+    with stage("optimize_dtypes", rows=len(df)):
+        before = memory_footprint(df)
+
+        df = df.drop(columns=['Vendas_validas'], errors='ignore')
+        df['Produto'] = df['Produto'].astype('category')
+        df['Data'] = df['Data'].dt.normalize()
 
-    df.describe()
+        for column in ['Quantidade', 'Preço Unitário', 'Total de Vendas']:
+            df[column] = _downcast_integer(df[column])
+
+        df.attrs['memory_footprint'] = {'before': before, 'after': memory_footprint(df)}
 
     return df
 
+
+def sum_by(df: pd.DataFrame, by: str, columns, parallel: bool = None):
+    """
+        Soma as colunas agrupando pela coluna informada.
+        As colunas inteiras compactas sao promovidas para int64 antes da soma, evitando overflow nos totais.
+        :param df -> DataFrame para a analise
+        :param by -> Coluna usada no agrupamento
+        :param columns -> Coluna ou lista de colunas a serem somadas
+        :param parallel -> Divide a soma entre varios processos (parallel_aggregation). Por padrão apenas
+            para frames com pelo menos PARALLEL_MIN_ROWS linhas (desativado enquanto PARALLEL_MIN_ROWS for None)
+        :return -> Series ou DataFrame com as somas
+    """
+
+    selected = [columns] if isinstance(columns, str) else list(columns)
+
+    if parallel is None:
+        parallel = PARALLEL_MIN_ROWS is not None and len(df) >= PARALLEL_MIN_ROWS and AGGREGATION_WORKERS > 1
+
+    result = None
+    if parallel:
+        with stage(f"sum_by.parallel ({by})", rows=len(df)):
+            result = partitioned_sum_by(df, by, selected)
+
+    # Colunas de agrupamento nao suportadas pela agregação em paralelo usam o groupby do pandas
+    if result is None:
+        widened = {column: 'int64' for column in selected if pd.api.types.is_integer_dtype(df[column])}
+        result = df[selected].astype(widened).groupby(df[by], observed=True).sum()
+
+    return result[columns] if isinstance(columns, str) else result
+
+
+@dataclass
+class SalesSummary:
+    """
+        Resumo das vendas usado pela pagina e pelo relatorio.
+        Guarda apenas os totais por produto e por dia, todas as metricas sao derivadas deles sem voltar ao frame original.
+    """
+
+    total_orders: int
+    by_product: pd.DataFrame  # index 'Produto', colunas 'Quantidade' e 'Total de Vendas'
+    by_day: pd.DataFrame  # index 'Data', colunas 'Quantidade' e 'Total de Vendas'
+    rejections: dict = field(default_factory=dict)  # quantidade de linhas rejeitadas por motivo
+    price_range: tuple = None  # menor e maior 'Preço Unitário'
+
+    @cached_property
+    def total_items_sold(self) -> int:
+        return int(self.by_product["Quantidade"].sum())
+
+    @cached_property
+    def total_billing(self) -> float:
+        return self.by_product["Total de Vendas"].sum().item()
+
+    @cached_property
+    def avg_ticket(self) -> float:
+        # Um periodo ou produto sem vendas tem ticket medio zero
+        return self.total_billing / self.total_orders if self.total_orders else 0.0
+
+    @cached_property
+    def best_selling_product(self) -> tuple:
+        """ Tupla com o produto mais vendido, a quantidade vendida e o total em vendas """
+        name = self.by_product["Quantidade"].idxmax()
+        return (name, *self.by_product.loc[name, ["Quantidade", "Total de Vendas"]])
+
+    @cached_property
+    def best_profitable_product(self) -> tuple:
+        """ Tupla com o produto mais lucrativo, a quantidade vendida e o total em vendas """
+        name = self.by_product["Total de Vendas"].idxmax()
+        return (name, *self.by_product.loc[name, ["Quantidade", "Total de Vendas"]])
+
+
+def build_summary(df: pd.DataFrame, parallel: bool = None) -> SalesSummary:
+    """
+        Calcula o resumo das vendas com uma agregação por produto e outra por dia
+        :param df -> DataFrame ja validado
+        :param parallel -> Repassado para sum_by. Use False quando ja estiver em um processo de um pool
+        :return -> SalesSummary
+    """
+
+    columns = ["Quantidade", "Total de Vendas"]
+
+    with stage("build_summary", rows=len(df)):
+        return SalesSummary(
+            total_orders=len(df),
+            by_product=sum_by(df, "Produto", columns, parallel),
+            by_day=sum_by(df, "Data", columns, parallel),
+            rejections=df.attrs.get('rejections', {}),
+            price_range=(df["Preço Unitário"].min(), df["Preço Unitário"].max()),
+        )
+
+
+class SalesCube:
+    """
+        Cubo de vendas pre agregado por (dia x produto), construido uma vez por arquivo.
+        Periodos, produtos e os graficos sao respondidos fatiando o cubo, sem voltar as linhas do frame.
+        Alem das somas o cubo guarda o menor e maior preço e quantidade de cada celula, usados pelos filtros da pagina.
+    """
+
+    SUM_COLUMNS = ["Quantidade", "Total de Vendas", "Pedidos"]
+
+    # Niveis de agregação disponiveis para a serie temporal
+    FREQUENCIES = {"Diário": "D", "Semanal": "W", "Mensal": "MS"}
+
+    def __init__(self, cube: pd.DataFrame, rejections: dict = None):
+        self.cube = cube
+        self.rejections = rejections or {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "SalesCube":
+        """
+            Constroi o cubo a partir do frame validado.
+            Linhas sem data ou produto nao tem celula no cubo: o validate ja as rejeita, e caso o frame ainda tenha
+            alguma elas sao contadas nas rejeições do cubo com os mesmos motivos, em vez de sumirem dos totais.
+        """
+
+        rejections = dict(df.attrs.get('rejections') or {})
+
+        missing_date, missing_product = missing_keys(df)
+        for reason, mask in [("DATA_AUSENTE", missing_date), ("PRODUTO_AUSENTE", missing_product & ~missing_date)]:
+            if mask.any():
+                rejections[reason] = rejections.get(reason, 0) + int(mask.sum())
+
+        columns = ["Quantidade", "Preço Unitário", "Total de Vendas"]
+        widened = {column: 'int64' for column in columns if pd.api.types.is_integer_dtype(df[column])}
+
+        grouped = df[columns].astype(widened).groupby([df["Data"], df["Produto"]], observed=True, sort=True)
+
+        cube = grouped.agg(**{
+            "Quantidade": ("Quantidade", "sum"),
+            "Total de Vendas": ("Total de Vendas", "sum"),
+            "Pedidos": ("Quantidade", "size"),
+            "Preço mínimo": ("Preço Unitário", "min"),
+            "Preço máximo": ("Preço Unitário", "max"),
+            "Quantidade mínima": ("Quantidade", "min"),
+            "Quantidade máxima": ("Quantidade", "max"),
+        })
+
+        return cls(cube, rejections)
+
+    @property
+    def nbytes(self) -> int:
+        return memory_footprint(self.cube)
+
+    # Como cada coluna do cubo e combinada quando dois cubos sao unidos
+    MERGE_AGGREGATIONS = {
+        "Quantidade": "sum",
+        "Total de Vendas": "sum",
+        "Pedidos": "sum",
+        "Preço mínimo": "min",
+        "Preço máximo": "max",
+        "Quantidade mínima": "min",
+        "Quantidade máxima": "max",
+    }
+
+    def merge(self, other: "SalesCube") -> "SalesCube":
+        """
+            Une dois cubos (ex: o historico e o arquivo do dia), sem voltar as linhas dos frames
+            :param other -> Cubo das novas vendas
+            :return -> Novo SalesCube com as celulas dos dois cubos combinadas
+        """
+
+        cube = pd.concat([self.cube, other.cube])
+        cube = cube.groupby(level=["Data", "Produto"], observed=True, sort=True).agg(self.MERGE_AGGREGATIONS)
+
+        return SalesCube(cube, self._merge_rejections(other))
+
+    def _merge_rejections(self, other: "SalesCube") -> dict:
+        rejections = dict(self.rejections)
+        for reason, count in other.rejections.items():
+            rejections[reason] = rejections.get(reason, 0) + count
+        return rejections
+
+    def append(self, other: "SalesCube") -> "SalesCube":
+        """
+            Une ao cubo um cubo de vendas a partir do ultimo dia deste (ex: o arquivo do dia seguinte).
+            Apenas as celulas dos dias presentes nos dois cubos (no maximo o ultimo dia deste) sao reagrupadas,
+            as demais sao apenas copiadas.
+            :param other -> Cubo das novas vendas, sem datas anteriores ao ultimo dia deste cubo
+            :return -> Novo SalesCube com as celulas dos dois cubos combinadas
+        """
+
+        if other.cube.empty:
+            return SalesCube(self.cube, self._merge_rejections(other))
+
+        # Os dois cubos estao ordenados por data: a primeira celula do outro tem o menor dia
+        dates = self.cube.index.get_level_values("Data")
+        split = dates.searchsorted(other.cube.index.get_level_values("Data")[0], side="left")
+
+        boundary = SalesCube(self.cube.iloc[split:]).merge(other)
+        cube = pd.concat([self.cube.iloc[:split], boundary.cube])
+
+        return SalesCube(cube, self._merge_rejections(other))
+
+    @property
+    def min_price(self):
+        return self.cube["Preço mínimo"].min()
+
+    @property
+    def max_price(self):
+        return self.cube["Preço máximo"].max()
+
+    @property
+    def min_quantity(self):
+        return self.cube["Quantidade mínima"].min()
+
+    @property
+    def max_quantity(self):
+        return self.cube["Quantidade máxima"].max()
+
+    def slice(self, start_date=None, end_date=None, products=None) -> "SalesCube":
+        """
+            Retorna o cubo restrito ao periodo e aos produtos
+            :param start_date -> Data inicial ou None
+            :param end_date -> Data final (inclusa) ou None
+            :param products -> Lista de produtos ou None/vazia para todos
+            :return -> SalesCube fatiado
+        """
+
+        cube = self.cube
+
+        if start_date is not None or end_date is not None:
+            start = None if start_date is None else pd.Timestamp(start_date)
+            end = None if end_date is None else pd.Timestamp(end_date) + pd.Timedelta(days=1) - pd.Timedelta(1)
+            cube = cube.loc[start:end]
+
+        if products:
+            cube = cube[cube.index.get_level_values("Produto").isin(products)]
+
+        return SalesCube(cube, self.rejections)
+
+    def by_day(self, freq: str = "D") -> pd.DataFrame:
+        """ Totais por dia, ou por semana ('W') e mes ('MS') para arquivos com varios anos """
+
+        sums = self.cube[self.SUM_COLUMNS]
+
+        if freq == "D":
+            return sums.groupby(level="Data").sum()
+
+        return sums.groupby(pd.Grouper(level="Data", freq=freq)).sum()
+
+    def by_product(self) -> pd.DataFrame:
+        """ Totais por produto """
+        return self.cube[self.SUM_COLUMNS].groupby(level="Produto", observed=True).sum()
+
+    def summary(self) -> SalesSummary:
+        """ Resumo das vendas do cubo, equivalente ao build_summary do frame original """
+
+        columns = ["Quantidade", "Total de Vendas"]
+
+        return SalesSummary(
+            total_orders=int(self.cube["Pedidos"].sum()),
+            by_product=self.by_product()[columns],
+            by_day=self.by_day()[columns],
+            rejections=self.rejections,
+            price_range=(self.min_price, self.max_price),
+        )
+
+
+# Quantidade de linhas lidas por vez no modo de leitura em blocos
+STREAM_CHUNK_SIZE = 100_000
+
+
+def _fold(accumulated, partial):
+    """ Soma um resultado parcial de agregação ao acumulado """
+    if accumulated is None:
+        return partial
+    return pd.concat([accumulated, partial]).groupby(level=0).sum()
+
+
+def stream_aggregates(file, chunk_size: int = STREAM_CHUNK_SIZE, seen: SeenRows = None) -> SalesSummary:
+    """
+        Le o arquivo csv em blocos, validando cada bloco e somando os resultados em agregados incrementais.
+        A memoria usada depende do tamanho do bloco, da quantidade de produtos/dias e dos hashes das linhas
+        ja vistas (8 bytes por linha distinta), e nao da largura das linhas do arquivo.
+        As linhas repetidas sao removidas mesmo quando estao em blocos diferentes.
+        :param file -> Caminho ou objeto do arquivo csv
+        :param chunk_size -> Quantidade de linhas por bloco
+        :param seen -> Conjunto de linhas ja vistas, para remover tambem as repetidas de envios anteriores
+        :return -> SalesSummary com o total de pedidos e as somas por produto e por dia
+    """
+
+    total_orders = 0
+    by_product = None
+    by_day = None
+    rejections = {}
+    min_price = max_price = None
+    seen = SeenRows() if seen is None else seen
+
+    columns = resolve_columns(sniff_header(file))
+
+    for chunk in pd.read_csv(file, chunksize=chunk_size, **reader_options(columns)):
+        _rename_columns(chunk, columns)
+        chunk = coerce_types(chunk)
+        chunk, duplicated = deduplicate(chunk, seen)
+        chunk, rejected = check_consistency(chunk)
+
+        for reason, count in rejection_counts(rejected).items():
+            rejections[reason] = rejections.get(reason, 0) + count
+        if len(duplicated):
+            rejections["DUPLICADA"] = rejections.get("DUPLICADA", 0) + len(duplicated)
+
+        if len(chunk):
+            min_price = chunk["Preço Unitário"].min() if min_price is None else min(min_price, chunk["Preço Unitário"].min())
+            max_price = chunk["Preço Unitário"].max() if max_price is None else max(max_price, chunk["Preço Unitário"].max())
+
+        total_orders += len(chunk)
+        by_product = _fold(by_product, chunk.groupby("Produto", observed=True)[["Quantidade", "Total de Vendas"]].sum())
+        by_day = _fold(by_day, chunk.groupby("Data")[["Quantidade", "Total de Vendas"]].sum())
+
+    # Um arquivo so com o cabeçalho ainda gera um bloco (vazio), entao a verificação e pela quantidade de linhas validas
+    if total_orders == 0:
+        raise no_valid_rows_error(rejections)
+
+    return SalesSummary(total_orders=total_orders, by_product=by_product, by_day=by_day.sort_index(), rejections=rejections,
+                        price_range=(min_price, max_price))
+
+
+# Cache dos frames ja validados, compartilhado entre as execuções do streamlit
+DATASET_CACHE = DataFrameCache()
+
+# Cache em disco dos frames ja validados, permite reabrir o mesmo arquivo sem ler o csv novamente
+DISK_CACHE = ColumnarCache()
+
+
+# Quantidade maxima de hashes de arquivos guardados por dataset_key
+FILE_HASHES_LIMIT = 1024
+
+_file_hashes = OrderedDict()
+_file_hashes_lock = threading.Lock()
+
+
+def _file_identity(file):
+    """
+        Identifica o arquivo sem ler o conteudo: o file_id dos arquivos enviados pelo streamlit (um novo a cada envio),
+        ou o caminho, tamanho e data de modificação dos arquivos no disco. None quando o arquivo nao pode ser identificado
+    """
+
+    file_id = getattr(file, "file_id", None)
+    if file_id is not None:
+        return ("upload", file_id)
+
+    if isinstance(file, (str, os.PathLike)):
+        stat = os.stat(file)
+        return (os.path.abspath(file), stat.st_size, stat.st_mtime_ns)
+
+    return None
+
+
+def dataset_key(file) -> str:
+    """
+        Chave do arquivo nos caches: hash do conteudo + versão do mapeamento e das validações.
+        O hash fica guardado pela identidade do arquivo, assim as reexecuções da pagina nao releem o historico inteiro.
+    """
+
+    identity = _file_identity(file)
+
+    with _file_hashes_lock:
+        digest = _file_hashes.get(identity) if identity is not None else None
+        if digest is not None:
+            _file_hashes.move_to_end(identity)
+
+    if digest is None:
+        with stage("hash_file"):
+            digest = hash_file(file)
+
+        if identity is not None:
+            with _file_hashes_lock:
+                _file_hashes[identity] = digest
+                while len(_file_hashes) > FILE_HASHES_LIMIT:
+                    _file_hashes.popitem(last=False)
+
+    return f"{digest}-{mapping_version()}"
+
+
+def load_validated_data(file, cache: DataFrameCache = DATASET_CACHE, disk_cache: ColumnarCache = DISK_CACHE) -> pd.DataFrame:
+    """
+        Carrega e valida o arquivo reaproveitando o resultado caso o mesmo conteudo ja tenha sido processado
+        Primeiro procura o frame na memoria, depois no cache em disco e so entao le o csv
+        :param file -> Caminho ou objeto do arquivo csv
+        :param cache -> Cache onde os frames validados ficam guardados
+        :param disk_cache -> Cache em disco, use None para desativar
+        :return -> DataFrame validado
+    """
+
+    key = dataset_key(file)
+
+    df = cache.get(key)
+    if df is not None:
+        return df
+
+    with stage("disk_cache.get") as record:
+        df = disk_cache.get(key) if disk_cache is not None else None
+        record.rows = None if df is None else len(df)
+
+    if df is None:
+        df, rejected = validate(load_data(file))
+
+        # O frame fica ordenado por data para que os filtros de periodo possam usar busca binaria
+        df = optimize_dtypes(df)
+
+        with stage("sort_by_date", rows=len(df)):
+            df = df.sort_values('Data', kind='stable', ignore_index=True)
+
+        if disk_cache is not None:
+            with stage("disk_cache.put", rows=len(df)):
+                disk_cache.put(key, df)
+                disk_cache.put(f"{key}-rejected", rejected)
+
+        cache.put(f"{key}:rejected", rejected)
+
+    df.attrs['dataset_key'] = key
+    cache.put(key, df)
+
+    return df.copy(deep=False)
+
+
+class SalesIndex:
+    """
+        Indices do frame para os filtros interativos:
+        - as linhas ficam ordenadas por data, entao um periodo vira um intervalo de linhas encontrado por busca binaria
+        - para cada produto guardamos as posições das suas linhas, assim filtrar produtos nao percorre o frame inteiro
+        As posições ficam em segmentos de linhas consecutivas: extend() ordena apenas as linhas adicionadas ao final do frame,
+        e os segmentos pequenos sao unidos aos anteriores quando chegam a metade do tamanho deles (como em SeenRows).
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        if not df['Data'].is_monotonic_increasing:
+            df = df.sort_values('Data', kind='stable', ignore_index=True)
+
+        self.df = df
+        self.dates = df['Data'].to_numpy()
+
+        products = df['Produto'] if isinstance(df['Produto'].dtype, pd.CategoricalDtype) else df['Produto'].astype('category')
+        self._codes = products.cat.codes.to_numpy()
+        self._product_codes = {product: code for code, product in enumerate(products.cat.categories)}
+
+        # Segmentos (primeira linha, posições agrupadas por produto, limites de cada produto)
+        self._segments = [self._segment(0, len(df))]
+
+    def _segment(self, start: int, stop: int) -> tuple:
+        """ Posições das linhas [start, stop) agrupadas por produto, mantendo a ordem de data dentro de cada produto """
+        codes = self._codes[start:stop]
+        rows_by_product = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[rows_by_product], np.arange(len(self._product_codes) + 1))
+        return start, rows_by_product, boundaries
+
+    @property
+    def products(self) -> list:
+        return list(self._product_codes)
+
+    @property
+    def nbytes(self) -> int:
+        # Inclui o frame: o indice em cache o mantem na memoria mesmo depois que o frame sai do cache
+        return memory_footprint(self.df) + sum(rows.nbytes + boundaries.nbytes for _, rows, boundaries in self._segments)
+
+    def extend(self, df: pd.DataFrame) -> 'SalesIndex':
+        """
+            Retorna o indice do frame formado por este frame seguido de novas linhas, sem alterar este indice
+            :param df -> Frame cujas primeiras linhas sao as deste indice e cujas datas continuam ordenadas
+            :return -> SalesIndex do frame
+        """
+
+        products = df['Produto']
+        index = object.__new__(SalesIndex)
+        index.df = df
+        index.dates = df['Data'].to_numpy()
+        index._codes = products.cat.codes.to_numpy()
+        # As categorias novas ficam no final, os codigos dos produtos que ja existiam nao mudam
+        index._product_codes = {product: code for code, product in enumerate(products.cat.categories)}
+        index._segments = self._segments + [index._segment(len(self.df), len(df))]
+
+        while len(index._segments) > 1:
+            (start, previous, _), (_, last, _) = index._segments[-2:]
+            if 2 * len(last) < len(previous):
+                break
+            index._segments[-2:] = [index._segment(start, len(df))]
+
+        return index
+    def date_range(self, start_date=None, end_date=None) -> tuple:
+        """ Retorna o intervalo de linhas [inicio, fim) das vendas entre as datas, incluindo o dia final """
+
+        start = 0 if start_date is None else np.searchsorted(self.dates, np.datetime64(pd.Timestamp(start_date)), side='left')
+        end = len(self.dates) if end_date is None else np.searchsorted(
+            self.dates, np.datetime64(pd.Timestamp(end_date) + pd.Timedelta(days=1)), side='left'
+        )
+
+        return int(start), int(end)
+
+    def product_rows(self, product) -> np.ndarray:
+        """ Retorna as posições (ordenadas) das linhas do produto """
+        code = self._product_codes.get(product)
+        if code is None:
+            return np.empty(0, dtype=np.intp)
+
+        rows = [
+            start + rows_by_product[boundaries[code]:boundaries[code + 1]]
+            # Segmentos anteriores a categoria do produto nao tem linhas dele
+            for start, rows_by_product, boundaries in self._segments if code + 1 < len(boundaries)
+        ]
+        return rows[0] if len(rows) == 1 else np.concatenate(rows)
+
+    def select(self, start_date=None, end_date=None, products=None) -> pd.DataFrame:
+        """
+            Filtra o frame pelo periodo e pelos produtos usando os indices
+            :param start_date -> Data inicial ou None
+            :param end_date -> Data final (inclusa) ou None
+            :param products -> Lista de produtos ou None/vazia para todos
+            :return -> DataFrame filtrado
+        """
+
+        start, end = self.date_range(start_date, end_date)
+
+        if not products:
+            return self.df.iloc[start:end]
+
+        rows = []
+        for product in products:
+            product_rows = self.product_rows(product)
+            first, last = np.searchsorted(product_rows, [start, end])
+            rows.append(product_rows[first:last])
+
+        return self.df.iloc[np.sort(np.concatenate(rows))]
+
+
+def get_rejected_rows(df: pd.DataFrame, cache: DataFrameCache = DATASET_CACHE, disk_cache: ColumnarCache = DISK_CACHE) -> pd.DataFrame:
+    """
+        Retorna as linhas rejeitadas nas validações do arquivo, com o motivo na coluna 'Motivo'
+        :param df -> DataFrame retornado por load_validated_data
+        :return -> DataFrame das linhas rejeitadas ou None caso elas nao estejam mais em cache
+    """
+
+    key = df.attrs.get('dataset_key')
+    if not key:
+        return None
+
+    rejected = cache.get(f"{key}:rejected")
+    if rejected is None and disk_cache is not None:
+        rejected = disk_cache.get(f"{key}-rejected")
+        if rejected is not None:
+            cache.put(f"{key}:rejected", rejected)
+
+    return rejected
+
+
+def get_sales_index(df: pd.DataFrame, cache: DataFrameCache = DATASET_CACHE) -> SalesIndex:
+    """
+        Retorna os indices do frame, reaproveitando os que ja foram construidos para o mesmo arquivo
+        :param df -> DataFrame retornado por load_validated_data
+        :param cache -> Cache onde os indices ficam guardados
+        :return -> SalesIndex
+    """
+
+    key = df.attrs.get('dataset_key')
+    index = cache.get(f"{key}:index") if key else None
+
+    if index is None:
+        with stage("sales_index", rows=len(df)):
+            index = SalesIndex(df)
+        if key:
+            cache.put(f"{key}:index", index)
+
+    return index
+
+
+def get_sales_cube(df: pd.DataFrame, cache: DataFrameCache = DATASET_CACHE) -> SalesCube:
+    """
+        Retorna o cubo de vendas do frame, reaproveitando o que ja foi construido para o mesmo arquivo
+        :param df -> DataFrame retornado por load_validated_data
+        :param cache -> Cache onde o cubo fica guardado
+        :return -> SalesCube
+    """
+
+    key = df.attrs.get('dataset_key')
+    cube = cache.get(f"{key}:cube") if key else None
+
+    if cube is None:
+        with stage("sales_cube", rows=len(df)):
+            cube = SalesCube.from_frame(df)
+        if key:
+            cache.put(f"{key}:cube", cube)
+
+    return cube
+
+
+def _combine_keys(*keys) -> str:
+    """ Chave do conjunto de arquivos, depende dos arquivos e da ordem em que foram adicionados """
+    return "combined-" + hashlib.blake2b("+".join(keys).encode(), digest_size=16).hexdigest()
+
+
+def _concat_datasets(frames: list) -> pd.DataFrame:
+    """ Concatena os frames mantendo 'Produto' como categoria (unindo as categorias de cada frame) """
+
+    products = union_categoricals([frame['Produto'] for frame in frames], ignore_order=True)
+
+    df = pd.concat([frame.drop(columns='Produto') for frame in frames], ignore_index=True)
+    df.insert(df.columns.get_loc('Data') + 1, 'Produto', products)
+
+    return df
+
+
+# Fator de crescimento da capacidade do ColumnBuffer quando as linhas novas nao cabem no espaço livre
+BUFFER_GROWTH = 1.5
+
+
+class ColumnBuffer:
+    """
+        Colunas de um conjunto de arquivos em arrays com espaço livre no final, para que adicionar linhas ao conjunto
+        copie apenas as linhas novas. O frame do conjunto e montado sobre as primeiras linhas dos arrays, sem copia-las.
+        As linhas ja escritas nunca sao alteradas, entao os frames montados antes de uma adição continuam validos.
+        'Produto' fica guardado como os codigos da categoria; produtos novos entram no final das categorias.
+    """
+
+    def __init__(self, df: pd.DataFrame, capacity: int = 0):
+        self.columns = list(df.columns)
+        self.categories = df['Produto'].cat.categories
+        self.length = len(df)
+        self._lock = threading.Lock()
+
+        capacity = max(capacity, len(df))
+        self.arrays = {}
+        for column in self.columns:
+            values = self._values(df, column)
+            self.arrays[column] = np.empty(capacity, dtype=values.dtype)
+            self.arrays[column][:len(df)] = values
+
+    @property
+    def nbytes(self) -> int:
+        # Apenas o espaço livre: as linhas em uso sao contadas pelos frames montados sobre elas
+        return sum(array.itemsize * (len(array) - self.length) for array in self.arrays.values())
+
+    @staticmethod
+    def _values(df: pd.DataFrame, column: str) -> np.ndarray:
+        return df[column].cat.codes.to_numpy() if column == 'Produto' else df[column].to_numpy()
+
+    def frame(self, length: int = None) -> pd.DataFrame:
+        """ Frame com as primeiras linhas do buffer (todas por padrão), sem copia """
+
+        length = self.length if length is None else length
+        data = {}
+        for column in self.columns:
+            values = self.arrays[column][:length]
+            if column == 'Produto':
+                values = pd.Categorical.from_codes(values, dtype=pd.CategoricalDtype(self.categories), validate=False)
+            data[column] = values
+
+        return pd.DataFrame(data, copy=False)
+
+    def append(self, length: int, new: pd.DataFrame) -> pd.DataFrame:
+        """
+            Escreve as linhas novas depois das primeiras 'length' linhas
+            :param length -> Quantidade de linhas do frame ao qual as novas sao adicionadas
+            :param new -> Linhas novas, com as mesmas colunas
+            :return -> Frame com todas as linhas, ou None quando o buffer ja recebeu outras linhas depois
+                dessas (o conjunto foi estendido por outro envio) e precisa ser copiado
+        """
+
+        with self._lock:
+            if length != self.length:
+                return None
+
+            categories = self.categories.append(new['Produto'].cat.categories.difference(self.categories, sort=False))
+            values = {
+                column: new['Produto'].cat.set_categories(categories).cat.codes.to_numpy() if column == 'Produto'
+                else new[column].to_numpy()
+                for column in self.columns
+            }
+
+            needed = self.length + len(new)
+            capacity = min(len(array) for array in self.arrays.values())
+            if needed > capacity:
+                capacity = max(needed, int(capacity * BUFFER_GROWTH))
+
+            for column, array in self.arrays.items():
+                # Os codigos da categoria e os inteiros compactos podem precisar de um tipo maior para as linhas novas
+                dtype = np.result_type(array.dtype, values[column].dtype)
+                if dtype != array.dtype or len(array) < capacity:
+                    grown = np.empty(capacity, dtype=dtype)
+                    grown[:self.length] = array[:self.length]
+                    self.arrays[column] = array = grown
+                array[self.length:needed] = values[column]
+
+            self.categories = categories
+            self.length = needed
+
+            return self.frame(needed)
+
+
+def get_seen_rows(df: pd.DataFrame, cache: DataFrameCache = DATASET_CACHE, disk_cache: ColumnarCache = DISK_CACHE) -> SeenRows:
+    """
+        Retorna o conjunto dos hashes das linhas do frame, procurando primeiro na memoria, depois no disco
+        e so entao calculando a partir das linhas (nesse caso ele tambem e salvo no disco)
+    """
+
+    key = df.attrs.get('dataset_key')
+
+    seen = cache.get(f"{key}:hashes") if key else None
+    if seen is not None:
+        return seen
+
+    stored = disk_cache.get(f"{key}-hashes") if key and disk_cache is not None else None
+    if stored is not None:
+        seen = SeenRows()
+        seen.runs = [stored['hash'].to_numpy()]
+    else:
+        seen = SeenRows(row_hashes(df))
+        if key and disk_cache is not None:
+            with stage("disk_cache.put", rows=len(seen)):
+                disk_cache.put(f"{key}-hashes", pd.DataFrame({'hash': seen.to_array()}))
+
+    if key:
+        cache.put(f"{key}:hashes", seen)
+
+    return seen
+
+
+def _combine_rejected(base: pd.DataFrame, new_frames: list, duplicated: pd.DataFrame, cache: DataFrameCache,
+                      disk_cache: ColumnarCache) -> pd.DataFrame:
+    """ Linhas rejeitadas do conjunto: as do conjunto anterior, as de cada arquivo novo e as repetidas entre eles """
+
+    parts = [get_rejected_rows(frame, cache, disk_cache) for frame in [base, *new_frames]]
+    if any(part is None for part in parts):
+        return None
+
+    parts.append(duplicated.assign(Motivo="DUPLICADA"))
+
+    # Frames vazios ficam de fora da concatenação para nao alterar os tipos das colunas
+    rejected = [part for part in parts if len(part)]
+    return pd.concat(rejected, ignore_index=True) if rejected else parts[0]
+
+
+def append_datasets(base: pd.DataFrame, new_frames: list, key: str, cache: DataFrameCache = DATASET_CACHE,
+                    disk_cache: ColumnarCache = DISK_CACHE) -> pd.DataFrame:
+    """
+        Adiciona novos arquivos a um conjunto ja carregado, com custo proporcional as linhas novas:
+        - as linhas novas sao comparadas com os hashes das linhas ja existentes para remover as repetidas
+        - as colunas do conjunto ficam em um ColumnBuffer, as linhas novas sao escritas no espaço livre dele
+        - o cubo de vendas e os indices do conjunto anterior sao atualizados apenas com as linhas novas
+        O conjunto anterior e removido do cache, ja que o novo conjunto contem todas as linhas dele.
+        Quando as linhas novas tem datas anteriores as ja carregadas o conjunto inteiro e reordenado e copiado.
+        :param base -> Conjunto ja carregado (retornado por load_validated_data ou load_validated_files)
+        :param new_frames -> Frames validados dos novos arquivos
+        :param key -> Chave do novo conjunto no cache
+        :return -> DataFrame com todas as linhas, ordenado por data
+    """
+
+    base_key = base.attrs['dataset_key']
+
+    with stage("append_datasets.deduplicate", rows=sum(len(frame) for frame in new_frames)) as record:
+        # O conjunto do frame anterior continua no cache, entao a atualização e feita em uma copia
+        seen = get_seen_rows(base, cache, disk_cache).copy()
+
+        new = _concat_datasets(new_frames) if len(new_frames) > 1 else new_frames[0]
+        new, duplicated = deduplicate(new, seen)
+        record.rows = len(new)
+
+    # Arquivos diarios costumam trazer datas posteriores as ja carregadas, nesse caso as linhas novas vao para o final
+    # (o conjunto ja esta ordenado por data, a ultima linha tem a maior data)
+    in_order = not (len(new) and len(base) and new['Data'].min() < base['Data'].iloc[-1])
+
+    with stage("append_datasets.concat", rows=len(new)) as record:
+        buffer = cache.get(f"{base_key}:buffer")
+        df = buffer.append(len(base), new) if buffer is not None and in_order else None
+
+        if df is None:
+            record.rows = len(base) + len(new)
+            df = _concat_datasets([base, new])
+            if not in_order:
+                df = df.sort_values('Data', kind='stable', ignore_index=True)
+
+            # As linhas passam a morar no buffer, com espaço para os proximos envios
+            buffer = ColumnBuffer(df, capacity=int(len(df) * BUFFER_GROWTH))
+            df = buffer.frame()
+
+    rejections = dict(base.attrs.get('rejections', {}))
+    for frame in new_frames:
+        for reason, count in frame.attrs.get('rejections', {}).items():
+            rejections[reason] = rejections.get(reason, 0) + count
+    dropped = len(duplicated)
+    if dropped:
+        rejections["DUPLICADA"] = rejections.get("DUPLICADA", 0) + dropped
+
+    df.attrs = {'dataset_key': key, 'rejections': rejections}
+
+    # O cubo e os indices do conjunto anterior sao atualizados apenas com as linhas novas
+    base_cube = cache.get(f"{base_key}:cube")
+    if base_cube is not None:
+        with stage("append_datasets.cube", rows=len(new)):
+            new_cube = SalesCube.from_frame(new)
+            # Com as datas em ordem apenas o ultimo dia do conjunto anterior pode ter celulas em comum com as novas
+            cube = base_cube.append(new_cube) if in_order else base_cube.merge(new_cube)
+            cube.rejections = rejections
+            cache.put(f"{key}:cube", cube)
+
+    base_index = cache.get(f"{base_key}:index")
+    if base_index is not None and in_order:
+        with stage("append_datasets.index", rows=len(new)):
+            cache.put(f"{key}:index", base_index.extend(df))
+
+    rejected = _combine_rejected(base, new_frames, duplicated, cache, disk_cache)
+    if rejected is not None:
+        cache.put(f"{key}:rejected", rejected)
+
+    cache.put(f"{key}:hashes", seen)
+    cache.put(f"{key}:buffer", buffer)
+    cache.put(key, df)
+
+    # O novo conjunto contem o anterior: manter os dois duplicaria o historico na memoria
+    cache.discard(*(f"{base_key}{suffix}" for suffix in ["", ":hashes", ":cube", ":index", ":rejected", ":buffer"]))
+
+    return df.copy(deep=False)
+
+
+def load_validated_files(files: list, cache: DataFrameCache = DATASET_CACHE, disk_cache: ColumnarCache = DISK_CACHE) -> pd.DataFrame:
+    """
+        Carrega varios arquivos como um unico conjunto de vendas, removendo as linhas repetidas entre eles.
+        Quando os primeiros arquivos ja foram carregados antes (ex: o historico), apenas os novos sao lidos,
+        validados e adicionados ao conjunto existente.
+        :param files -> Lista de caminhos ou objetos de arquivos csv, na ordem em que foram recebidos
+        :return -> DataFrame com todas as linhas validas
+    """
+
+    if len(files) == 1:
+        return load_validated_data(files[0], cache, disk_cache)
+
+    file_keys = [dataset_key(file) for file in files]
+
+    # Chave de cada prefixo da lista de arquivos: o primeiro arquivo, os dois primeiros, ...
+    prefix_keys = [file_keys[0]]
+    for file_key in file_keys[1:]:
+        prefix_keys.append(_combine_keys(prefix_keys[-1], file_key))
+
+    # Procura o maior prefixo que ja esta em cache
+    start = 0
+    base = None
+    for i in range(len(files) - 1, 0, -1):
+        base = cache.get(prefix_keys[i])
+        if base is not None:
+            start = i
+            break
+
+    if base is None:
+        base = load_validated_data(files[0], cache, disk_cache)
+
+    if start == len(files) - 1:
+        return base
+
+    new_frames = [load_validated_data(file, cache, disk_cache) for file in files[start + 1:]]
+
+    return append_datasets(base, new_frames, prefix_keys[-1], cache, disk_cache)
+
+
 def get_best_selling_product(data: pd.Series) -> tuple:
     """
         função analisa o data frame e retor o produto mais vedido, valor total em vendas, quantidade vendida e relação a outro produtos
@@ -97,12 +1374,7 @@ def get_best_selling_product(data: pd.Series) -> tuple:
         :return -> Tupla com o produto mais vendido e o valor total de vendas
     """
    
-    products_and_total_sales = data.groupby("Produto").agg(
-        {
-            "Quantidade": "sum",
-            "Total de Vendas": "sum"
-        }
-    ) # Agrupando os dados por produto e calculando o total de vendas
+    products_and_total_sales = sum_by(data, "Produto", ["Quantidade", "Total de Vendas"]) # Agrupando os dados por produto e calculando o total de vendas
 
     # Extraindo o nome do produto mais vendido
     best_selling_product = products_and_total_sales["Quantidade"].idxmax()
@@ -126,7 +1398,7 @@ def get_best_profitable_product(df:pd.DataFrame):
     """
 
 
-    data = df.groupby("Produto")["Total de Vendas"].sum()
+    data = sum_by(df, "Produto", "Total de Vendas")
     
     best_profitable_product = data.idxmax()
     best_profitable_total_sales = data.max()
@@ -137,13 +1409,16 @@ def get_best_profitable_product(df:pd.DataFrame):
 def filter_by_date (df: pd.DataFrame, start_date, end_date, column:str):
     """
         A função e resposavel por filtrar os dados para uma data especifica
+        O frame recebido nao e alterado
         :param -> DataFrame para a analise
         :param -> Data para a filtragem
         :return -> DataFrame filtrado
     """
 
-    df[column] = df[column].dt.date
-    df = df[(df[column] >= start_date) & (df[column] <= end_date)]
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
+
+    df = df[(df[column] >= start) & (df[column] < end)]
 
     
     return df
@@ -162,144 +1437,33 @@ def get_avarage_ticket(df: pd.DataFrame):
 
     return avarage_ticket
     
-def generate_pdf(data_report: dict, report_name: str = "relatorio.pdf"):
-    import pdfkit
+
+def generate_pdf(data_report: dict, report_name: str = "relatorio.pdf", save: bool = True) -> bytes:
+    """
+        Gera o relatorio em pdf
+        :param data_report -> Dicionario com o resumo, as imagens dos graficos e os filtros usados (ver report.render_report_html)
+        :param report_name -> Nome do arquivo salvo na pasta Documentos/relatorios
+        :param save -> Caso False o pdf nao e salvo no disco, apenas retornado
+        :return -> Conteudo do pdf
+    """
     from platformdirs import user_documents_dir
     from pathlib import Path
-    import platform
 
+    with stage("generate_pdf.html"):
+        context = report_context(data_report)
+        html = render_html(context)
 
-    
-
-    products = ''
-    if data_report["filters_chart_distribuition_by_product"]["selected_products"] != []:
-        for product in data_report["filters_chart_distribuition_by_product"]["selected_products"]:
-            products += f'{product} '
-    else:
-        products = 'Todos os produtos'
-
-    data = {
-        **data_report["metrics"],
-        **data_report["graphics_path"],
-        **data_report["filters_chart_distribuition_by_product"],
-        **data_report["filters_chart_total_sales"],
-        "products": products
-    }
-
-    html = """
-    <!DOCTYPE html>
-        <html lang="pt-br">
-        <head>
-            <meta charset="UTF-8">
-            <title>Relatório de Vendas</title>
-            <style>
-                body {{ max-width: 750px; font-family: 'Times New Roman', Times, serif; }}
-                .container {{ display: flex; flex-direction: column; align-items: center; }}
-                .content-insights {{ display: flex; justify-content: space-between; }}
-                .content-insights div {{ margin: 0 10px; }}
-                .pie-charts {{ display: flex; justify-content: space-between; }}
-                .pie-charts img, .chart img {{ max-width: 100%; height: auto; }}
-                .filters-dp {{ display: flex; font-size: 10pt; }}
-                .chart {{ margin-bottom: 20px; }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Relatório de Vendas</h1>
-
-                <h2>Insights</h2>
-                <div class="content-insights">
-                    <div>
-                        <h4>Total de Pedidos</h4>
-                        <p>{total_orders}</p>
-                    </div>
-                    <div>
-                        <h4>Total de Itens Vendidos</h4>
-                        <p>{total_items_sold}</p>
-                    </div>
-                    <div>
-                        <h4>Faturamento Total</h4>
-                        <p>R$ {total_biling}</p>
-                    </div>
-                    <div>
-                        <h4>Ticket Médio</h4>
-                        <p>R$ {avg_ticket}</p>
-                    </div>
-                </div>
-
-                <h2>Gráficos de Produto</h2>
-                <div class="pie-charts">
-                    <div>
-                        <h4>Mais Lucrativo</h4>
-                        <img src="{best_profitable}" alt="Mais Lucrativo">
-                    </div>
-                    <div>
-                        <h4>Mais Vendido</h4>
-                        <img src="{best_selling_product}" alt="Mais Vendido">
-                    </div>
-                </div>
-
-                <h2>Vendas Totais</h2>
-                <div class="chart">
-                    <img src="{total_sales}" alt="Vendas Totais">
-                </div>
-
-                <h2>Distribuição por Produto</h2>
-                <div class="filters-dp">
-                    <p><strong>De:</strong> {data_range_dbp[0]} até {data_range_dbp[1]}</p>
-                    <p><strong>Produto(s):</strong>{products}</p>
-                    <p><strong>Faixa de preço:</strong> R$ {min_price} até R$ {max_price}</p>
-                    <p><strong>Quantidade mínima vendida:</strong> {min_quantity}</p>
-                </div>
-                <div class="chart">
-                    <img src="{sales_distribuition}" alt="Distribuição por Produto">
-                </div>
-            </div>
-        </body>
-        </html>
-
-    """.format(**data)
-
-    system = platform.system()
-
-    if system == "Windows":
-        wkhtmltopdf_path = "C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe"
-    elif system == "Linux":
-        wkhtmltopdf_path = "/usr/bin/wkhtmltopdf"
-    else:
-        print("Sistema nao suportado")
-
-    config = pdfkit.configuration(wkhtmltopdf=wkhtmltopdf_path)
-
-    options = {
-        'encoding': 'UTF-8',
-        'enable-local-file-access': None,  # Necessário para imagens locais
-        'page-size': 'A4',
-        'margin-top': '0.75in',
-        'margin-right': '0.75in',
-        'margin-bottom': '0.75in',
-        'margin-left': '0.75in',
-    }
-
-    documents_path = Path(user_documents_dir()) / "relatorios"
-    documents_path.mkdir(parents=True, exist_ok=True)
-
-    full_path = f"{documents_path}/{report_name}"
-    
-    pdfkit.from_string(html, full_path, options=options, configuration=config)
-
-def save_chart_as_temp_image(fig: Figure) -> str:
-
-    """
-        Função responsavel por salvar uma imagem temporariamente no sistema e retornar o caminho/nome dela
-        :param -> Figura para a imagem
-        :return -> Caminho para a imagem
-    """
+    # A conversão entra na fila de pdf do processo (wkhtmltopdf, ou o renderizador alternativo quando nao esta instalado)
+    with stage("generate_pdf.render"):
+        pdf = render_pdf(html, context)
 
-    temp_file = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+    if save:
+        documents_path = Path(user_documents_dir()) / "relatorios"
+        documents_path.mkdir(parents=True, exist_ok=True)
 
-    fig.write_image(temp_file.name)
+        if not report_name.lower().endswith(".pdf"):
+            report_name = f"{report_name}.pdf"
 
-    temp_file.close()
+        (documents_path / report_name).write_bytes(pdf)
 
-    return temp_file.name
\ No newline at end of file
+    return pdf
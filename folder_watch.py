@@ -0,0 +1,62 @@
+""" Monitoramento de uma pasta de arquivos csv, usado para adicionar os novos arquivos ao painel automaticamente """
+
+import threading
+from pathlib import Path
+
+
+_watchers = {}
+_watchers_lock = threading.Lock()
+
+
+class FolderWatcher:
+    """
+        Observa uma pasta com o watchdog e marca quando algum csv e criado, alterado ou movido para ela.
+        A pagina consulta a marcação periodicamente e recarrega os dados quando ha novidades.
+    """
+
+    def __init__(self, folder):
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        self.folder = Path(folder)
+        self._changed = threading.Event()
+
+        watcher = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                paths = [getattr(event, "src_path", ""), getattr(event, "dest_path", "")]
+                if not event.is_directory and any(str(path).lower().endswith(".csv") for path in paths):
+                    watcher._changed.set()
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), str(self.folder), recursive=False)
+        self._observer.daemon = True
+        self._observer.start()
+
+    def files(self) -> list:
+        """ Arquivos csv da pasta, do mais antigo para o mais novo (ordem em que os arquivos diarios chegaram) """
+        return [str(path) for path in sorted(self.folder.glob("*.csv"), key=lambda path: path.stat().st_mtime)]
+
+    def consume_changes(self) -> bool:
+        """ Retorna True caso a pasta tenha mudado desde a ultima consulta """
+        changed = self._changed.is_set()
+        self._changed.clear()
+        return changed
+
+    def stop(self):
+        self._observer.stop()
+        self._observer.join()
+
+
+def get_watcher(folder) -> FolderWatcher:
+    """ Retorna o observador da pasta, criando apenas um por pasta para todas as sessoes """
+
+    folder = str(Path(folder).resolve())
+
+    with _watchers_lock:
+        if folder not in _watchers:
+            if not Path(folder).is_dir():
+                raise ValueError(f"A pasta {folder} não existe.")
+            _watchers[folder] = FolderWatcher(folder)
+        return _watchers[folder]
@@ -0,0 +1,116 @@
+"""
+    Medição do tempo, das linhas processadas e da variação de memoria de cada etapa do pipeline
+
+    uso em scripts:
+        with instrumentation.recording() as recorder:
+            df = dp.load_validated_data("vendas.csv")
+        recorder.dump_json("diagnostico.json")
+"""
+
+import json
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+
+
+_current_recorder = ContextVar("current_recorder", default=None)
+
+# Quantidade de etapas abertas no contexto atual, uma etapa dentro de outra tem profundidade 1, 2, ...
+_current_depth = ContextVar("current_depth", default=0)
+
+
+def current_rss() -> int:
+    """ Memoria residente do processo em bytes, ou None quando o sistema nao permite a leitura """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+@dataclass
+class StageRecord:
+    """ Medição de uma etapa """
+
+    name: str
+    depth: int = 0  # 0 para as etapas que nao estao dentro de outra
+    seconds: float = 0.0
+    rows: int = None
+    memory_delta_mb: float = None
+    error: str = None
+
+
+class Recorder:
+    """ Guarda as medições das etapas executadas enquanto esta ativo """
+
+    def __init__(self):
+        self.records = []
+
+    def to_dict(self) -> list:
+        return [asdict(record) for record in self.records]
+
+    def dump_json(self, path: str):
+        """ Salva as medições em um arquivo json para analise posterior """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    @property
+    def total_seconds(self) -> float:
+        """ Soma apenas as etapas de primeiro nivel, o tempo das etapas internas ja esta contado nelas """
+        return sum(record.seconds for record in self.records if record.depth == 0)
+
+
+@contextmanager
+def recording(recorder: Recorder = None):
+    """ Ativa um Recorder para as etapas executadas dentro do bloco (na thread/contexto atual) """
+
+    recorder = recorder or Recorder()
+    token = _current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _current_recorder.reset(token)
+
+
+def start_recording(recorder: Recorder = None) -> Recorder:
+    """
+        Ativa um Recorder para o restante da execução no contexto atual, sem precisar de um bloco with.
+        Usado pela pagina do streamlit, onde cada execução do script roda no contexto da sua sessao.
+    """
+
+    recorder = recorder or Recorder()
+    _current_recorder.set(recorder)
+    return recorder
+
+
+@contextmanager
+def stage(name: str, rows: int = None):
+    """
+        Mede uma etapa do pipeline. Sem um Recorder ativo nao faz nada.
+        A quantidade de linhas pode ser informada no inicio ou preenchida dentro do bloco (record.rows = ...)
+    """
+
+    recorder = _current_recorder.get()
+    if recorder is None:
+        yield StageRecord(name)
+        return
+
+    record = StageRecord(name, depth=_current_depth.get(), rows=rows)
+    depth_token = _current_depth.set(record.depth + 1)
+    rss_before = current_rss()
+    start = time.perf_counter()
+
+    try:
+        yield record
+    except Exception as e:
+        record.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record.seconds = time.perf_counter() - start
+        _current_depth.reset(depth_token)
+        rss_after = current_rss()
+        if rss_before is not None and rss_after is not None:
+            record.memory_delta_mb = (rss_after - rss_before) / 1024 ** 2
+        recorder.records.append(record)
@@ -0,0 +1,182 @@
+"""
+    Agregação por produto e por dia dividida entre varios processos
+
+    As colunas usadas sao copiadas uma unica vez para blocos de memoria compartilhada; cada processo soma uma faixa
+    de linhas (np.bincount sobre os codigos dos grupos) e devolve apenas os totais parciais, que sao somados no final.
+    Nenhuma linha do frame e serializada entre os processos.
+"""
+
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+
+# Tamanho minimo do frame (em linhas) para usar a agregação em paralelo por padrão. None desativa o uso automatico:
+# nas medições feitas ate agora (benchmarks/bench_parallel_aggregation.py) o groupby do pandas nao foi mais lento,
+# entao o valor so deve ser definido depois de medir o ganho na maquina onde o APP roda
+PARALLEL_MIN_ROWS = None
+
+# Quantidade de processos usados na agregação
+AGGREGATION_WORKERS = os.cpu_count() or 1
+
+# Quantidade maxima de grupos (produtos ou dias) suportada, os totais parciais de cada processo tem esse tamanho
+MAX_GROUPS = 5_000_000
+
+_aggregation_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_aggregation_executor() -> ProcessPoolExecutor:
+    """ Retorna o pool de processos da agregação, criado apenas na primeira chamada e mantido entre as agregações """
+    global _aggregation_executor
+
+    with _executor_lock:
+        if _aggregation_executor is None:
+            _aggregation_executor = ProcessPoolExecutor(max_workers=AGGREGATION_WORKERS)
+        return _aggregation_executor
+
+
+def shutdown_aggregation_executor():
+    """ Encerra o pool de processos da agregação """
+    global _aggregation_executor
+
+    with _executor_lock:
+        if _aggregation_executor is not None:
+            _aggregation_executor.shutdown()
+            _aggregation_executor = None
+
+
+def group_codes(key: pd.Series):
+    """
+        Converte a coluna de agrupamento em codigos inteiros de 0 a n-1, sem percorrer os valores com hash:
+        - categorias usam os proprios codigos
+        - datas apenas com o dia (como depois do optimize_dtypes) viram a quantidade de dias desde a menor data
+        :return -> Tupla (codigos, quantidade de grupos, função que monta o index a partir dos codigos observados),
+            ou None quando a coluna nao e suportada (o groupby do pandas deve ser usado)
+    """
+
+    if isinstance(key.dtype, pd.CategoricalDtype):
+        codes = key.cat.codes.to_numpy()
+        if (codes < 0).any():
+            return None
+        return codes, len(key.cat.categories), lambda observed: pd.CategoricalIndex(
+            pd.Categorical.from_codes(observed, dtype=key.dtype), name=key.name
+        )
+
+    if pd.api.types.is_datetime64_dtype(key.dtype):
+        values = key.to_numpy().view("int64")
+        if key.isna().any():
+            return None
+
+        # Tamanho de um dia na unidade da coluna (ns, us, ms ou s)
+        day = np.int64(np.timedelta64(1, "D") / np.timedelta64(1, np.datetime_data(key.dtype)[0]))
+
+        first = values.min()
+        offsets = values - first
+        if (offsets % day).any():
+            return None
+
+        days = offsets // day
+        groups = int(days.max()) + 1
+        return days, groups, lambda observed: pd.DatetimeIndex(
+            (first + observed.astype("int64") * day).view(key.dtype), name=key.name
+        )
+
+    return None
+
+
+def _attach(name: str, dtype: str, length: int):
+    """ Abre um bloco de memoria compartilhada criado pelo processo principal """
+    # O bloco pertence ao processo principal, que e o responsavel por remove-lo (os processos do pool apenas fecham)
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(length, dtype=dtype, buffer=block.buf)
+
+
+def _partial_sums(codes_spec: tuple, value_specs: list, start: int, stop: int, groups: int) -> np.ndarray:
+    """
+        Executado em cada processo: soma as linhas [start, stop) por grupo
+        :return -> Array (1 + colunas, grupos) com a quantidade de linhas e a soma de cada coluna por grupo
+    """
+
+    blocks = []
+    try:
+        block, codes = _attach(*codes_spec)
+        blocks.append(block)
+        codes = codes[start:stop]
+
+        result = np.empty((1 + len(value_specs), groups), dtype="float64")
+        result[0] = np.bincount(codes, minlength=groups)
+
+        for i, spec in enumerate(value_specs, start=1):
+            block, values = _attach(*spec)
+            blocks.append(block)
+            result[i] = np.bincount(codes, weights=values[start:stop], minlength=groups)
+
+        return result
+    finally:
+        for block in blocks:
+            block.close()
+
+
+def _share(array: np.ndarray, blocks: list) -> tuple:
+    """ Copia o array para um novo bloco de memoria compartilhada e retorna (nome, dtype, tamanho) """
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    blocks.append(block)
+    np.copyto(np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf), array)
+    return block.name, array.dtype.str, len(array)
+
+
+def partitioned_sum_by(df: pd.DataFrame, by: str, columns: list, workers: int = None) -> pd.DataFrame:
+    """
+        Soma as colunas agrupando pela coluna informada, dividindo as linhas entre os processos do pool.
+        As somas sao feitas em float64 e convertidas de volta para int64 nas colunas inteiras
+        (exatas enquanto cada total for menor que 2^53).
+        :param df -> DataFrame para a analise
+        :param by -> Coluna de agrupamento ('Produto' como categoria ou 'Data' apenas com o dia)
+        :param columns -> Lista de colunas numericas a serem somadas
+        :param workers -> Quantidade de partições, por padrão AGGREGATION_WORKERS
+        :return -> DataFrame com as somas, no mesmo formato do groupby(observed=True).sum() do pandas,
+            ou None quando a coluna de agrupamento nao e suportada
+    """
+
+    grouping = group_codes(df[by])
+    if grouping is None:
+        return None
+
+    codes, groups, make_index = grouping
+    if groups > MAX_GROUPS:
+        return None
+
+    workers = workers or AGGREGATION_WORKERS
+    bounds = np.linspace(0, len(df), workers + 1, dtype="int64")
+
+    blocks = []
+    try:
+        codes_spec = _share(np.ascontiguousarray(codes), blocks)
+        value_specs = [_share(np.ascontiguousarray(df[column].to_numpy(), dtype="float64"), blocks) for column in columns]
+
+        executor = get_aggregation_executor()
+        futures = [
+            executor.submit(_partial_sums, codes_spec, value_specs, int(start), int(stop), groups)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if stop > start
+        ]
+        totals = sum(future.result() for future in futures)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    observed = np.flatnonzero(totals[0])
+
+    result = pd.DataFrame(
+        {column: totals[i, observed] for i, column in enumerate(columns, start=1)},
+        index=make_index(observed),
+    )
+
+    integer = {column: "int64" for column in columns if pd.api.types.is_integer_dtype(df[column])}
+    return result.astype(integer)
@@ -0,0 +1,398 @@
+"""
+    Conversão do relatorio para pdf
+
+    Os relatorios entram em uma fila atendida por um numero limitado de workers mantidos entre os relatorios.
+    O wkhtmltopdf e usado quando esta instalado; caso contrario o pdf e montado com o pillow a partir dos mesmos dados
+    do template (sem o html), para que o relatorio funcione em qualquer ambiente.
+"""
+
+import base64
+import io
+import os
+import platform
+import shutil
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+
+from cache import BlobCache, hash_bytes
+from rendering import REPORT_CACHE
+
+
+# Quantidade de relatorios convertidos ao mesmo tempo
+PDF_WORKERS = min(2, os.cpu_count() or 1)
+
+# Quantidade maxima de relatorios aguardando na fila, alem dos que estao sendo convertidos.
+# Com a fila cheia, quem envia um novo relatorio espera uma vaga.
+PDF_QUEUE_LIMIT = 16
+
+# Renderizador escolhido pela variavel de ambiente PDF_RENDERER ("wkhtmltopdf" ou "pillow"), por padrão o primeiro disponivel
+PDF_RENDERER = os.environ.get("PDF_RENDERER", "auto")
+
+WKHTMLTOPDF_PATHS = {
+    "Windows": "C:/Program Files/wkhtmltopdf/bin/wkhtmltopdf.exe",
+    "Linux": "/usr/bin/wkhtmltopdf",
+    "Darwin": "/usr/local/bin/wkhtmltopdf",
+}
+
+WKHTMLTOPDF_OPTIONS = {
+    'encoding': 'UTF-8',
+    'enable-local-file-access': None,  # Necessário para imagens locais
+    'page-size': 'A4',
+    'margin-top': '0.75in',
+    'margin-right': '0.75in',
+    'margin-bottom': '0.75in',
+    'margin-left': '0.75in',
+}
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def find_wkhtmltopdf() -> str:
+    """ Caminho do wkhtmltopdf: variavel WKHTMLTOPDF_PATH, PATH do sistema ou o local padrão de instalação. None caso nao exista """
+
+    candidates = [os.environ.get("WKHTMLTOPDF_PATH"), shutil.which("wkhtmltopdf"), WKHTMLTOPDF_PATHS.get(platform.system())]
+
+    for path in candidates:
+        if path and os.path.isfile(path):
+            return path
+
+    return None
+
+
+class WkhtmltopdfRenderer:
+    """ Converte o html com o wkhtmltopdf. A configuração do pdfkit e criada uma unica vez e reaproveitada """
+
+    name = "wkhtmltopdf"
+
+    def __init__(self, path: str):
+        import pdfkit
+
+        self._pdfkit = pdfkit
+        self.path = path
+        self.configuration = pdfkit.configuration(wkhtmltopdf=path)
+
+    def render(self, html: str, context: dict) -> bytes:
+        return self._pdfkit.from_string(html, False, options=WKHTMLTOPDF_OPTIONS, configuration=self.configuration)
+
+
+# Fontes com acentuação procuradas no sistema; sem nenhuma delas e usada a fonte padrão do pillow
+PDF_FONTS = ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf")
+
+
+def _load_font(image_font, size: int):
+    for font in PDF_FONTS:
+        try:
+            return image_font.truetype(font, size)
+        except OSError:
+            continue
+    return image_font.load_default(size=size)
+
+
+class PillowRenderer:
+    """
+        Monta o pdf sem o wkhtmltopdf: desenha o titulo, os indicadores, os graficos e as tabelas em paginas A4
+        com o pillow. O layout e mais simples que o do html, mas o conteudo e o mesmo.
+    """
+
+    name = "pillow"
+
+    DPI = 100
+    PAGE_SIZE = (827, 1169)  # A4 em 100 dpi
+    MARGIN = 75  # 0.75in, a mesma margem do wkhtmltopdf
+
+    def __init__(self):
+        from PIL import Image, ImageDraw, ImageFont
+
+        self._image = Image
+        self._draw = ImageDraw
+        self.fonts = {size: _load_font(ImageFont, size) for size in (10, 12, 14, 18, 26)}
+
+    def render(self, html: str, context: dict) -> bytes:
+        page = _PillowPage(self)
+
+        page.text(context["title"], 26, spacing=20)
+
+        page.text("Insights", 18, spacing=10)
+        for metric in context["metrics"]:
+            page.text(f"{metric['label']}: {metric['value']}", 12)
+
+        for section in context["sections"]:
+            page.text(section["title"], 18, spacing=10, before=20)
+
+            for label, value in section.get("filters") or []:
+                page.text(f"{label}: {value}", 10)
+
+            page.charts(section["charts"])
+
+        for table in context["tables"]:
+            page.text(table["title"], 18, spacing=10, before=20)
+            page.table(table["columns"], table["rows"])
+
+        return page.save()
+
+    def load_image(self, src: str):
+        """ Abre a imagem do grafico a partir de um data URI ou de um caminho. None para formatos que o pillow nao abre (svg) """
+
+        try:
+            if src.startswith("data:"):
+                header, encoded = src.split(",", 1)
+                if "svg" in header:
+                    return None
+                return self._image.open(io.BytesIO(base64.b64decode(encoded))).convert("RGB")
+            return self._image.open(src).convert("RGB")
+        except (OSError, ValueError):
+            return None
+
+
+class _PillowPage:
+    """ Cursor de escrita das paginas do PillowRenderer, criando uma nova pagina quando o conteudo nao cabe """
+
+    def __init__(self, renderer: PillowRenderer):
+        self.renderer = renderer
+        self.pages = []
+        self.width = renderer.PAGE_SIZE[0] - 2 * renderer.MARGIN
+        self._new_page()
+
+    def _new_page(self):
+        image = self.renderer._image.new("RGB", self.renderer.PAGE_SIZE, "white")
+        self.pages.append(image)
+        self.draw = self.renderer._draw.Draw(image)
+        self.y = self.renderer.MARGIN
+
+    def _reserve(self, height: int):
+        if self.y + height > self.renderer.PAGE_SIZE[1] - self.renderer.MARGIN and self.y > self.renderer.MARGIN:
+            self._new_page()
+
+    def text(self, value, size: int, spacing: int = 4, before: int = 0):
+        font = self.renderer.fonts[size]
+        self.y += before
+        self._reserve(size + spacing)
+        self.draw.text((self.renderer.MARGIN, self.y), str(value), fill="black", font=font)
+        self.y += size + spacing
+
+    def charts(self, charts: list):
+        """ Graficos lado a lado na mesma linha, redimensionados para a largura disponivel """
+
+        if not charts:
+            return
+
+        column_width = (self.width - 10 * (len(charts) - 1)) // len(charts)
+        cells = []
+
+        for chart in charts:
+            image = self.renderer.load_image(chart["src"])
+            if image is not None:
+                # Mantem a proporção, limitada a largura da coluna e a altura de uma pagina
+                max_height = self.renderer.PAGE_SIZE[1] - 2 * self.renderer.MARGIN - 18
+                scale = min(column_width / image.width, max_height / image.height)
+                image = image.resize((int(image.width * scale), int(image.height * scale)))
+            cells.append((chart.get("title"), image))
+
+        row_height = max((image.height if image else 14) for _, image in cells) + (18 if any(title for title, _ in cells) else 0)
+        self._reserve(row_height)
+
+        for i, (title, image) in enumerate(cells):
+            x = self.renderer.MARGIN + i * (column_width + 10)
+            y = self.y
+
+            if title:
+                self.draw.text((x, y), str(title), fill="black", font=self.renderer.fonts[14])
+                y += 18
+
+            if image is None:
+                self.draw.text((x, y), "(imagem indisponivel)", fill="gray", font=self.renderer.fonts[10])
+            else:
+                self.pages[-1].paste(image, (x, y))
+
+        self.y += row_height + 10
+
+    def table(self, columns: list, rows: list):
+        """ Tabela simples, a primeira coluna ocupa metade da largura e as demais dividem o restante """
+
+        first = self.width // 2
+        others = (self.width - first) // max(len(columns) - 1, 1)
+        positions = [self.renderer.MARGIN] + [self.renderer.MARGIN + first + i * others for i in range(len(columns) - 1)]
+        font = self.renderer.fonts[10]
+
+        for i, row in enumerate([columns, *rows]):
+            self._reserve(16)
+            for x, value in zip(positions, row):
+                self.draw.text((x, self.y), str(value)[:60], fill="black", font=font)
+            self.y += 16
+            if i == 0:
+                self.draw.line((self.renderer.MARGIN, self.y - 2, self.renderer.MARGIN + self.width, self.y - 2), fill="gray")
+
+    def save(self) -> bytes:
+        buffer = io.BytesIO()
+        self.pages[0].save(buffer, "PDF", save_all=True, append_images=self.pages[1:], resolution=self.renderer.DPI)
+        return buffer.getvalue()
+
+
+def create_renderer(name: str = PDF_RENDERER):
+    """ Cria o renderizador pedido, ou o primeiro disponivel (wkhtmltopdf e depois pillow) quando name e 'auto' """
+
+    if name in ("auto", "wkhtmltopdf"):
+        path = find_wkhtmltopdf()
+        if path is not None:
+            return WkhtmltopdfRenderer(path)
+        if name == "wkhtmltopdf":
+            raise RuntimeError("wkhtmltopdf não encontrado. Instale-o ou informe o caminho na variavel WKHTMLTOPDF_PATH.")
+
+    if name in ("auto", "pillow"):
+        return PillowRenderer()
+
+    raise ValueError(f"Renderizador de pdf desconhecido: {name}")
+
+
+@dataclass
+class RenderStats:
+    """ Medições da fila de conversão """
+
+    renderer: str
+    workers: int
+    queued: int = 0
+    running: int = 0
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    @property
+    def avg_seconds(self) -> float:
+        finished = self.completed + self.failed
+        return self.total_seconds / finished if finished else 0.0
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "avg_seconds": self.avg_seconds}
+
+
+class RenderQueue:
+    """
+        Fila de conversão para pdf com uma quantidade fixa de workers (threads que executam o renderizador).
+        Os workers e a configuração do renderizador sao mantidos entre os relatorios.
+    """
+
+    def __init__(self, renderer=None, workers: int = PDF_WORKERS, queue_limit: int = PDF_QUEUE_LIMIT):
+        self.renderer = renderer or create_renderer()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-render")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self._stats = RenderStats(renderer=self.renderer.name, workers=workers)
+
+    def submit(self, html: str, context: dict) -> Future:
+        """ Coloca o relatorio na fila. Com a fila cheia espera uma vaga antes de retornar """
+
+        self._slots.acquire()
+
+        with self._lock:
+            self._stats.submitted += 1
+            self._stats.queued += 1
+
+        try:
+            return self._executor.submit(self._run, html, context)
+        except Exception:
+            self._release()
+            raise
+
+    def render(self, html: str, context: dict) -> bytes:
+        """ Converte o relatorio esperando a vez na fila """
+        return self.submit(html, context).result()
+
+    def _run(self, html: str, context: dict) -> bytes:
+        with self._lock:
+            self._stats.queued -= 1
+            self._stats.running += 1
+
+        start = time.perf_counter()
+        failed = True
+
+        try:
+            pdf = self.renderer.render(html, context)
+            failed = False
+            return pdf
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self._stats.running -= 1
+                self._stats.total_seconds += seconds
+                self._stats.max_seconds = max(self._stats.max_seconds, seconds)
+                if failed:
+                    self._stats.failed += 1
+                else:
+                    self._stats.completed += 1
+            self._slots.release()
+
+    def _release(self):
+        """ Desfaz a entrada na fila quando o envio ao executor falha """
+        with self._lock:
+            self._stats.submitted -= 1
+            self._stats.queued -= 1
+        self._slots.release()
+
+    @property
+    def queue_depth(self) -> int:
+        """ Relatorios aguardando um worker """
+        return self._stats.queued
+
+    def stats(self) -> RenderStats:
+        """ Copia das medições atuais """
+        with self._lock:
+            return RenderStats(**asdict(self._stats))
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def get_render_queue() -> RenderQueue:
+    """ Retorna a fila de conversão do processo, criada na primeira chamada """
+    global _queue
+
+    with _queue_lock:
+        if _queue is None:
+            _queue = RenderQueue()
+        return _queue
+
+
+def shutdown_render_queue():
+    """ Encerra a fila de conversão e os workers """
+    global _queue
+
+    with _queue_lock:
+        if _queue is not None:
+            _queue.shutdown()
+            _queue = None
+
+
+def render_stats() -> RenderStats:
+    """ Medições da fila de conversão do processo, ou None caso nenhum relatorio tenha sido gerado """
+    queue = _queue
+    return queue.stats() if queue is not None else None
+
+
+def render_pdf(html: str, context: dict, cache: BlobCache = REPORT_CACHE) -> bytes:
+    """
+        Converte o relatorio para pdf usando a fila do processo
+        :param html -> html do relatorio, usado pelo wkhtmltopdf
+        :param context -> Dados do relatorio (report.report_context), usados pelo renderizador alternativo
+        :param cache -> Cache dos pdfs ja gerados. O html traz os indicadores, filtros, tabelas e as imagens
+            dos graficos, entao o seu hash identifica o relatorio. None para sempre gerar
+        :return -> Conteudo do pdf
+    """
+
+    queue = get_render_queue()
+
+    if cache is None:
+        return queue.render(html, context)
+
+    key = hash_bytes(html, queue.renderer.name)
+    pdf = cache.get(key, "pdf")
+
+    if pdf is None:
+        pdf = queue.render(html, context)
+        cache.put(key, pdf, "pdf")
+
+    return pdf
@@ -0,0 +1,137 @@
+""" Exportação dos graficos em paralelo para o relatorio """
+
+import base64
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from cache import BlobCache, hash_bytes
+from instrumentation import stage
+
+
+# Quantidade de processos que exportam graficos ao mesmo tempo
+CHART_WORKERS = min(4, os.cpu_count() or 1)
+
+_chart_executor = None
+_executor_lock = threading.Lock()
+
+# Imagens dos graficos e pdfs ja gerados, endereçados pelo hash das entradas
+REPORT_CACHE = BlobCache()
+
+
+@dataclass
+class ChartImage:
+    """ Imagem exportada de um grafico e o tempo gasto na exportação """
+
+    name: str
+    data: bytes
+    format: str
+    seconds: float
+    path: str = None
+    cached: bool = False
+
+    # Tipos MIME dos formatos que podem ser embutidos no html do relatorio
+    MIME_TYPES = {"png": "image/png", "jpeg": "image/jpeg", "jpg": "image/jpeg", "svg": "image/svg+xml", "webp": "image/webp"}
+
+    @property
+    def data_uri(self) -> str:
+        """ Imagem no formato data URI, para ser usada diretamente no src de uma tag <img> """
+        encoded = base64.b64encode(self.data).decode("ascii")
+        return f"data:{self.MIME_TYPES[self.format]};base64,{encoded}"
+
+
+def _warm_up_renderer():
+    """
+        Executado uma vez em cada processo do pool: exporta uma figura vazia para iniciar o kaleido/chrome,
+        assim os graficos do relatorio ja encontram o renderizador aberto.
+    """
+    try:
+        pio.to_image(go.Figure(), format="png", width=10, height=10)
+    except Exception:
+        # Caso o kaleido nao esteja disponivel o erro aparece na exportação do grafico
+        pass
+
+
+def _render_chart(figure: dict, fmt: str) -> tuple:
+    """ Exporta a figura (em formato de dicionario) e retorna os bytes da imagem e o tempo gasto """
+    start = time.perf_counter()
+    data = pio.to_image(figure, format=fmt)
+    return data, time.perf_counter() - start
+
+
+def get_chart_executor() -> ProcessPoolExecutor:
+    """ Retorna o pool de processos de exportação, criado apenas na primeira chamada e mantido entre os relatorios """
+    global _chart_executor
+
+    # Os relatorios sao gerados em threads (report_jobs), duas delas nao podem criar pools separados
+    with _executor_lock:
+        if _chart_executor is None:
+            _chart_executor = ProcessPoolExecutor(max_workers=CHART_WORKERS, initializer=_warm_up_renderer)
+        return _chart_executor
+
+
+def shutdown_chart_executor():
+    """ Encerra o pool de exportação e os renderizadores abertos """
+    global _chart_executor
+
+    with _executor_lock:
+        if _chart_executor is not None:
+            _chart_executor.shutdown()
+            _chart_executor = None
+
+
+def render_charts(figures: dict, fmt: str = "png", parallel: bool = True, cache: BlobCache = REPORT_CACHE) -> dict:
+    """
+        Exporta varios graficos ao mesmo tempo usando o pool de processos
+        :param figures -> Dicionario nome -> Figura plotly
+        :param fmt -> Formato da imagem (png, svg, ...)
+        :param parallel -> Caso False os graficos sao exportados em sequencia no proprio processo
+        :param cache -> Cache das imagens ja exportadas, endereçado pelo hash da figura. None para sempre exportar
+        :return -> Dicionario nome -> ChartImage, na mesma ordem das figuras
+    """
+
+    with stage("render_charts") as record:
+        images = _render_all(figures, fmt, parallel, cache)
+        record.rows = len(images)
+
+    return images
+
+
+def _render_all(figures: dict, fmt: str, parallel: bool, cache: BlobCache) -> dict:
+    images = {}
+    pending = {}
+
+    for name, fig in figures.items():
+        figure = fig.to_dict()
+
+        if cache is not None:
+            key = hash_bytes(fig.to_json(), fmt)
+            data = cache.get(key, fmt)
+            if data is not None:
+                images[name] = ChartImage(name=name, data=data, format=fmt, seconds=0.0, cached=True)
+                continue
+        else:
+            key = None
+
+        pending[name] = (figure, key)
+
+    if not parallel or len(pending) <= 1:
+        results = {name: _render_chart(figure, fmt) for name, (figure, _) in pending.items()}
+    else:
+        executor = get_chart_executor()
+        futures = {name: executor.submit(_render_chart, figure, fmt) for name, (figure, _) in pending.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    for name, (data, seconds) in results.items():
+        images[name] = ChartImage(name=name, data=data, format=fmt, seconds=seconds)
+
+        key = pending[name][1]
+        if key is not None:
+            cache.put(key, data, fmt)
+
+    return {name: images[name] for name in figures}
@@ -0,0 +1,133 @@
+""" Montagem do html do relatorio a partir dos templates Jinja2 da pasta templates/ """
+
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from rendering import ChartImage
+
+
+TEMPLATES_DIR = Path(__file__).parent / "templates"
+
+# Template padrão do relatorio
+REPORT_TEMPLATE = "report.html"
+
+# Quantidade de produtos na tabela padrão do relatorio
+REPORT_TOP_PRODUCTS = 20
+
+# O ambiente guarda os templates ja compilados, assim cada template e compilado apenas uma vez por processo
+_environment = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    autoescape=select_autoescape(["html"]),
+    auto_reload=False,
+    trim_blocks=True,
+    lstrip_blocks=True,
+)
+
+
+def format_brl(value: float) -> str:
+    """ Formata o valor no padrão brasileiro, ex: 1.234,56 """
+    return f"{value:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+
+
+def image_src(image) -> str:
+    """ As imagens podem vir como caminhos de arquivos ou como ChartImage em memoria, embutidas no html como data URI """
+    return image.data_uri if isinstance(image, ChartImage) else image
+
+
+def default_sections(data_report: dict) -> list:
+    """ Seções padrão do relatorio: graficos de produto, vendas totais e distribuição por produto com os filtros usados """
+
+    graphics = data_report["graphics_path"]
+    filters = data_report["filters_chart_distribuition_by_product"]
+
+    selected_products = filters["selected_products"]
+    products = " ".join(str(product) for product in selected_products) if selected_products else "Todos os produtos"
+
+    return [
+        {
+            "title": "Gráficos de Produto",
+            "charts": [
+                {"title": "Mais Lucrativo", "src": image_src(graphics["best_profitable"])},
+                {"title": "Mais Vendido", "src": image_src(graphics["best_selling_product"])},
+            ],
+        },
+        {
+            "title": "Vendas Totais",
+            "charts": [{"title": None, "src": image_src(graphics["total_sales"])}],
+        },
+        {
+            "title": "Distribuição por Produto",
+            "filters": [
+                ("De", f"{filters['data_range_dbp'][0]} até {filters['data_range_dbp'][1]}"),
+                ("Produto(s)", products),
+                ("Faixa de preço", f"R$ {filters['min_price']} até R$ {filters['max_price']}"),
+                ("Quantidade mínima vendida", filters["min_quantity"]),
+            ],
+            "charts": [{"title": None, "src": image_src(graphics["sales_distribuition"])}],
+        },
+    ]
+
+
+def product_table(summary, top: int = REPORT_TOP_PRODUCTS) -> dict:
+    """ Tabela com os produtos de maior faturamento """
+
+    products = summary.by_product.sort_values("Total de Vendas", ascending=False).head(top)
+
+    return {
+        "title": f"Top {len(products)} produtos por faturamento",
+        "columns": ["Produto", "Quantidade", "Total de Vendas"],
+        "rows": [
+            (product, f"{int(row['Quantidade']):,}".replace(",", "."), f"R$ {format_brl(row['Total de Vendas'])}")
+            for product, row in products.iterrows()
+        ],
+    }
+
+
+def report_context(data_report: dict) -> dict:
+    """
+        Monta os dados usados pelos templates (e pelo renderizador de pdf alternativo)
+        :param data_report -> Dicionario com o resumo ('summary'), as imagens e os filtros usados.
+            Pode trazer 'sections' (lista de seções com 'title', 'charts', 'filters') e 'tables' (lista de tabelas
+            com 'title', 'columns', 'rows') para substituir as seções e tabelas padrão, e 'title' para o titulo.
+        :return -> Dicionario com title, metrics, sections e tables
+    """
+
+    summary = data_report["summary"]
+
+    sections = data_report.get("sections")
+    if sections is None:
+        sections = default_sections(data_report)
+
+    tables = data_report.get("tables")
+    if tables is None:
+        tables = [product_table(summary)]
+
+    metrics = [
+        {"label": "Total de Pedidos", "value": summary.total_orders},
+        {"label": "Total de Itens Vendidos", "value": summary.total_items_sold},
+        {"label": "Faturamento Total", "value": f"R$ {format_brl(summary.total_billing)}"},
+        {"label": "Ticket Médio", "value": f"R$ {format_brl(summary.avg_ticket)}"},
+    ]
+
+    return {
+        "title": data_report.get("title", "Relatório de Vendas"),
+        "metrics": metrics,
+        "sections": sections,
+        "tables": tables,
+    }
+
+
+def render_html(context: dict, template_name: str = REPORT_TEMPLATE) -> str:
+    """ Renderiza o template com os dados montados por report_context """
+    return _environment.get_template(template_name).render(**context)
+
+
+def render_report_html(data_report: dict, template_name: str = REPORT_TEMPLATE) -> str:
+    """
+        Monta o html do relatorio
+        :param data_report -> Dicionario com o resumo, as imagens e os filtros usados (ver report_context)
+        :param template_name -> Template da pasta templates/
+        :return -> html do relatorio
+    """
+    return render_html(report_context(data_report), template_name)
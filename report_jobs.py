@@ -0,0 +1,199 @@
+"""
+    Geração dos relatorios em segundo plano
+
+    A pagina envia o relatorio para a fila e consulta o andamento periodicamente, assim continua respondendo
+    enquanto os graficos sao exportados e o pdf e gerado. Pedidos identicos enquanto o primeiro ainda esta
+    em andamento recebem o mesmo trabalho, sem gerar o relatorio duas vezes.
+"""
+
+import hashlib
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import data_processing as dp
+from rendering import render_charts
+
+
+# Quantidade de relatorios gerados ao mesmo tempo, somando todas as sessoes
+REPORT_JOB_WORKERS = 2
+
+# Quantidade maxima de relatorios aguardando ou em andamento. Acima disso novos pedidos sao recusados
+REPORT_JOB_LIMIT = 8
+
+# Tempo em segundos que um trabalho concluido fica disponivel para download
+REPORT_JOB_TTL = 30 * 60
+
+PENDING, RUNNING, DONE, FAILED = "pendente", "em andamento", "concluido", "erro"
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+class ReportQueueFullError(RuntimeError):
+    """ A fila de relatorios atingiu o limite """
+
+
+@dataclass
+class ReportJob:
+    """ Estado de um relatorio enviado para a fila """
+
+    id: str
+    key: str
+    status: str = PENDING
+    progress: float = 0.0
+    message: str = "Aguardando na fila"
+    result: object = None
+    error: str = None
+    created: float = field(default_factory=time.time)
+    finished: float = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def update(self, progress: float, message: str):
+        """ Chamado pela função do trabalho para informar o andamento """
+        self.progress = progress
+        self.message = message
+
+
+class ReportJobManager:
+    """ Executa os relatorios em um pool de threads limitado e guarda o estado de cada um """
+
+    def __init__(self, workers: int = REPORT_JOB_WORKERS, limit: int = REPORT_JOB_LIMIT, ttl: float = REPORT_JOB_TTL):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="report-job")
+        self._limit = limit
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._in_flight = {}
+
+    def submit(self, key: str, func, *args) -> ReportJob:
+        """
+            Envia um trabalho para a fila
+            :param key -> Identificador das entradas do relatorio; pedidos com a mesma chave em andamento sao reaproveitados
+            :param func -> Função executada em segundo plano, recebe o ReportJob seguido de args e retorna o resultado
+            :return -> ReportJob, novo ou o que ja estava em andamento para a mesma chave
+        """
+
+        with self._lock:
+            self._expire()
+
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job
+
+            if len(self._in_flight) >= self._limit:
+                raise ReportQueueFullError("Muitos relatórios sendo gerados no momento, tente novamente em instantes.")
+
+            job = ReportJob(id=uuid.uuid4().hex, key=key)
+            self._jobs[job.id] = job
+            self._in_flight[key] = job
+
+        self._executor.submit(self._run, job, func, args)
+        return job
+
+    def _run(self, job: ReportJob, func, args: tuple):
+        job.status = RUNNING
+        job.update(0.0, "Iniciando")
+
+        try:
+            job.result = func(job, *args)
+            job.status = DONE
+            job.update(1.0, "Relatório gerado")
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._in_flight.pop(job.key, None)
+
+    def _expire(self):
+        """ Remove os trabalhos concluidos ha mais tempo que o ttl """
+        limit = time.time() - self._ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished < limit]:
+            del self._jobs[job_id]
+
+    def get(self, job_id: str) -> ReportJob:
+        """ Retorna o trabalho, ou None caso nao exista ou tenha expirado """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    @property
+    def queue_depth(self) -> int:
+        """ Trabalhos aguardando ou em andamento """
+        return len(self._in_flight)
+
+    def shutdown(self):
+        self._executor.shutdown()
+
+
+def get_job_manager() -> ReportJobManager:
+    """ Retorna o gerenciador de relatorios do processo, compartilhado por todas as sessoes """
+    global _manager
+
+    with _manager_lock:
+        if _manager is None:
+            _manager = ReportJobManager()
+        return _manager
+
+
+def report_key(figures: dict, data_report: dict, report_name: str) -> str:
+    """ Hash das entradas do relatorio: dados dos graficos, indicadores, filtros e nome """
+
+    summary = data_report["summary"]
+    digest = hashlib.blake2b(digest_size=16)
+
+    digest.update(report_name.encode("utf-8"))
+    digest.update(json.dumps(
+        [summary.total_orders, summary.total_items_sold, summary.total_billing],
+        default=str,
+    ).encode("utf-8"))
+    digest.update(json.dumps(
+        {name: value for name, value in data_report.items() if name not in ("summary", "graphics_path")},
+        sort_keys=True, default=str,
+    ).encode("utf-8"))
+
+    for name in sorted(figures):
+        digest.update(name.encode("utf-8"))
+        digest.update(figures[name].to_json().encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+@dataclass
+class ReportResult:
+    """ Resultado de um relatorio gerado em segundo plano """
+
+    pdf: bytes
+    chart_seconds: dict
+
+
+def generate_report(job: ReportJob, figures: dict, data_report: dict, report_name: str) -> ReportResult:
+    """ Exporta os graficos e gera o pdf, informando o andamento no trabalho """
+
+    job.update(0.1, "Exportando gráficos")
+    images = render_charts(figures)
+
+    job.update(0.6, "Gerando PDF")
+    pdf = dp.generate_pdf({**data_report, 'graphics_path': images}, report_name)
+
+    # Imagens que vieram do cache ficam sem tempo de exportação
+    return ReportResult(pdf=pdf, chart_seconds={name: None if image.cached else image.seconds for name, image in images.items()})
+
+
+def submit_report(figures: dict, data_report: dict, report_name: str) -> ReportJob:
+    """
+        Envia o relatorio para geração em segundo plano
+        :param figures -> Dicionario nome -> Figura plotly dos graficos do relatorio
+        :param data_report -> Dicionario com o resumo e os filtros usados, sem as imagens (ver dp.generate_pdf)
+        :param report_name -> Nome do arquivo do relatorio
+        :return -> ReportJob para acompanhar o andamento
+    """
+    key = report_key(figures, data_report, report_name)
+    return get_job_manager().submit(key, generate_report, figures, data_report, report_name)
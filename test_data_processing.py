@@ -0,0 +1,103 @@
+"""
+    Testes da adição de arquivos a um conjunto ja carregado (append_datasets): o frame, o cubo, os indices e as
+    linhas rejeitadas do conjunto devem ser iguais aos da validação de um unico arquivo com todas as linhas.
+
+    uso: python -m pytest -q test_data_processing.py
+"""
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing as dp
+from cache import ColumnarCache, DataFrameCache
+
+
+MOCK_DATA = Path(__file__).parent / "MOCK_DATA.csv"
+
+
+def _split_files(directory: Path, in_order: bool) -> list:
+    """
+        Divide o MOCK_DATA em 4 arquivos. Cada arquivo repete algumas linhas do anterior (removidas como DUPLICADA).
+        Em ordem: cada arquivo tem datas a partir do ultimo dia do anterior. Fora de ordem: as linhas sao sorteadas.
+    """
+
+    raw = pd.read_csv(MOCK_DATA)
+    if in_order:
+        raw = raw.iloc[np.argsort(pd.to_datetime(raw["data"], format="%m/%d/%Y").to_numpy(), kind="stable")]
+    else:
+        raw = raw.sample(frac=1, random_state=0)
+
+    # O primeiro arquivo e pequeno, assim os produtos dos proximos fazem os codigos da categoria crescerem
+    bounds = [0, 100, 400, 700, len(raw)]
+    files = []
+    for i, (start, stop) in enumerate(zip(bounds[:-1], bounds[1:])):
+        part = raw.iloc[max(start - 20, 0):stop]
+        path = directory / f"parte_{i}.csv"
+        part.to_csv(path, index=False)
+        files.append(path)
+
+    return files
+
+
+def _normalized(df: pd.DataFrame) -> pd.DataFrame:
+    """ Frame com os produtos como texto, para comparar frames com categorias em ordens diferentes """
+    return df.astype({"Produto": str}).reset_index(drop=True)
+
+
+def _normalized_cube(cube: dp.SalesCube) -> pd.DataFrame:
+    return _normalized(cube.cube.reset_index()).sort_values(["Data", "Produto"], ignore_index=True)
+
+
+@pytest.mark.parametrize("in_order", [True, False])
+def test_append_matches_single_file(tmp_path, in_order):
+    files = _split_files(tmp_path, in_order)
+
+    cache = DataFrameCache()
+    disk_cache = ColumnarCache(tmp_path / "cache")
+
+    # Como na pagina: o cubo e os indices de cada conjunto ficam em cache antes do proximo envio
+    for count in range(1, len(files) + 1):
+        df = dp.load_validated_files(files[:count], cache, disk_cache)
+        dp.get_sales_cube(df, cache)
+        dp.get_sales_index(df, cache)
+
+    combined = tmp_path / "completo.csv"
+    pd.concat([pd.read_csv(file) for file in files]).to_csv(combined, index=False)
+    expected = dp.load_validated_data(combined, DataFrameCache(), None)
+
+    pd.testing.assert_frame_equal(_normalized(df), _normalized(expected), check_dtype=False)
+    assert df.attrs["rejections"] == expected.attrs["rejections"]
+
+    cube = dp.get_sales_cube(df, cache)
+    pd.testing.assert_frame_equal(_normalized_cube(cube), _normalized_cube(dp.SalesCube.from_frame(expected)), check_dtype=False)
+
+    index = dp.get_sales_index(df, cache)
+    expected_index = dp.SalesIndex(expected)
+    assert sorted(index.products) == sorted(expected_index.products)
+    for product in expected_index.products:
+        np.testing.assert_array_equal(index.product_rows(product), expected_index.product_rows(product))
+
+    rejected = dp.get_rejected_rows(df, cache, disk_cache)
+    assert dp.rejection_counts(rejected) == expected.attrs["rejections"]
+
+    # Apenas o ultimo conjunto fica em memoria
+    assert dp._combine_keys(*[dp.dataset_key(file) for file in files[:2]]) not in cache
+
+
+def test_seen_rows_matches_unique():
+    rng = np.random.default_rng(0)
+    seen = dp.SeenRows()
+    added = []
+
+    for size in [1000, 10, 300, 5, 5, 2000, 1, 700]:
+        hashes = rng.integers(0, 5000, size, dtype=np.uint64)
+        expected_new = ~np.isin(hashes, np.concatenate(added)) if added else np.ones(size, dtype=bool)
+        np.testing.assert_array_equal(~seen.contains(hashes), expected_new)
+
+        seen.add(hashes)
+        added.append(hashes)
+
+    np.testing.assert_array_equal(seen.to_array(), np.unique(np.concatenate(added)))